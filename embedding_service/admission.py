@@ -0,0 +1,57 @@
+import asyncio, time
+from contextlib import asynccontextmanager
+
+
+class Overloaded(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionController:
+    # Lets at most `max_in_flight` requests run at once and parks up to
+    # `max_queue` more until a slot frees up. Anything beyond that, and any request
+    # whose client deadline (epoch seconds) passes before it gets a slot, is
+    # rejected with Overloaded straight away instead of being served late.
+    # max_in_flight = 0 disables the limit; deadlines are still enforced.
+
+    def __init__(self, max_in_flight = 64, max_queue = 128):
+        self.max_in_flight = max(0, int(max_in_flight))
+        self.max_queue = max(0, int(max_queue))
+        self.in_flight = 0
+        self.waiting = 0
+        self._slots = None
+
+    def _semaphore(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self._slots
+
+    @asynccontextmanager
+    async def admit(self, deadline = None):
+        if deadline is not None and deadline <= time.time():
+            raise Overloaded("deadline")
+
+        if not self.max_in_flight:
+            yield
+            return
+
+        slots = self._semaphore()
+        if slots.locked() and self.waiting >= self.max_queue:
+            raise Overloaded("queue_full")
+
+        self.waiting += 1
+        try:
+            timeout = None if deadline is None else deadline - time.time()
+            await asyncio.wait_for(slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded("deadline")
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            slots.release()
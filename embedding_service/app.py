@@ -1,50 +1,257 @@
-from fastapi import FastAPI
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
+import asyncio, json, logging, os, queue, random, time
+from logging.handlers import QueueHandler, QueueListener
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+import torch
+from admission import AdmissionController, Overloaded
+from batcher import MicroBatcher
+from matcher import BATCH_MAX_SIZE, Matcher, parse_query
+from metrics import Registry
 
-app = FastAPI()
+load_dotenv()
 
-COLLECTION = "troubleshooters"
-SIM_THRESHOLD = 0.25
-TOP_K = 3
-EF_SEARCH = 128
+LOG_SAMPLE_RATE = float(os.getenv("MATCH_LOG_SAMPLE_RATE", 0.01))
+BATCH_WINDOW_MS = float(os.getenv("MATCH_BATCH_WINDOW_MS", 5))
+MAX_BATCH_QUERIES = int(os.getenv("MATCH_MAX_BATCH_QUERIES", 2048))
+MAX_CONCURRENT_BATCHES = int(os.getenv("MATCH_MAX_CONCURRENT_BATCHES", 2))
 
-model = SentenceTransformer("all-mpnet-base-v2")
-client = QdrantClient(host = "localhost", port = 6333)
+# Admission control: beyond MATCH_MAX_IN_FLIGHT running and MATCH_MAX_QUEUE
+# waiting requests, and for requests whose client deadline has already passed,
+# the service answers 503 with Retry-After right away instead of queueing work
+# nobody will read. MATCH_MAX_IN_FLIGHT=0 disables the limit.
+MAX_IN_FLIGHT = int(os.getenv("MATCH_MAX_IN_FLIGHT", 64))
+MAX_QUEUE = int(os.getenv("MATCH_MAX_QUEUE", 128))
+RETRY_AFTER_SECONDS = max(1, int(os.getenv("MATCH_RETRY_AFTER_SECONDS", 1)))
+
+# Every uvicorn worker gets ENCODE_WORKERS inference threads, each running torch
+# with TORCH_NUM_THREADS intra-op threads. The default splits the machine's cores
+# across WEB_CONCURRENCY workers so several workers never oversubscribe the CPU.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+ENCODE_WORKERS = max(1, int(os.getenv("ENCODE_WORKERS", 1)))
+TORCH_NUM_THREADS = max(1, int(os.getenv(
+    "TORCH_NUM_THREADS",
+    (os.cpu_count() or 1) // (WEB_CONCURRENCY * ENCODE_WORKERS)
+)))
+
+torch.set_num_threads(TORCH_NUM_THREADS)
+encode_executor = ThreadPoolExecutor(max_workers = ENCODE_WORKERS, thread_name_prefix = "encode")
+
+# Log records are handed to a queue and written by a listener thread, so the
+# request path never blocks on stdout.
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, logging.StreamHandler())
+logger = logging.getLogger("embedding_service")
+logger.setLevel(logging.INFO)
+logger.addHandler(QueueHandler(log_queue))
+logger.propagate = False
+
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram("embedding_request_seconds", "End-to-end request handling time")
+IN_FLIGHT = metrics.gauge("embedding_in_flight_requests", "Requests currently being handled")
+SHED = metrics.counter("embedding_shed_total", "Requests rejected by admission control by reason")
+ERRORS = metrics.counter("embedding_errors_total", "Failed requests by exception type")
+
+# The service waits for its collections to appear instead of failing startup.
+matcher = Matcher(wait_for_collection = True, executor = encode_executor, registry = metrics)
+
+metrics.gauge("embedding_cache_hits", "Embedding cache hits", lambda: sum(t.cache.hits for t in matcher.tiers))
+metrics.gauge("embedding_cache_misses", "Embedding cache misses", lambda: sum(t.cache.misses for t in matcher.tiers))
+metrics.gauge("embedding_cache_hit_ratio", "Embedding cache hit ratio", lambda: matcher.primary.cache.stats()["hit_rate"])
+
+startup_state = {"ready": False, "error": None, "phases": matcher.phases}
+
+def run_startup():
+    matcher.start()
+    startup_state["ready"] = True
+
+async def startup():
+    try:
+        await asyncio.get_running_loop().run_in_executor(encode_executor, run_startup)
+    except Exception as e:
+        startup_state["error"] = f"{type(e).__name__}: {e}"
+        print(f"[STARTUP ERROR] - {e}")
+
+admission = AdmissionController(max_in_flight = MAX_IN_FLIGHT, max_queue = MAX_QUEUE)
+metrics.gauge("embedding_admission_waiting", "Requests waiting for an admission slot", lambda: admission.waiting)
+
+def request_deadline(request):
+    # Clients send either an absolute X-Request-Deadline (epoch seconds) or how
+    # long they are still willing to wait as X-Request-Timeout-Ms.
+    deadline = request.headers.get("x-request-deadline")
+    timeout_ms = request.headers.get("x-request-timeout-ms")
+
+    try:
+        if deadline:
+            return float(deadline)
+        if timeout_ms:
+            return time.time() + float(timeout_ms) / 1000
+    except ValueError:
+        raise HTTPException(status_code = 400, detail = "Invalid request deadline header")
+
+    return None
+
+def shed(endpoint, e):
+    SHED.inc(endpoint = endpoint, reason = e.reason)
+    return HTTPException(
+        status_code = 503,
+        detail = "Request deadline passed" if e.reason == "deadline" else "Service is overloaded",
+        headers = {"Retry-After": str(RETRY_AFTER_SECONDS)}
+    )
+
+def require_ready():
+    if not startup_state["ready"]:
+        raise HTTPException(status_code = 503, detail = "Service is starting up")
+
+def log_sample(spec, matches, tier):
+    if random.random() >= LOG_SAMPLE_RATE:
+        return
+
+    logger.info(json.dumps({
+        "event": "match",
+        "query": spec["query"],
+        "top_k": spec["top_k"],
+        "tier": tier,
+        "matches": [(m["troubleshooter_id"], round(m["score"], 4)) for m in matches]
+    }))
+
+def log_error(endpoint, e):
+    ERRORS.inc(endpoint = endpoint, type = type(e).__name__)
+    logger.error(json.dumps({"event": "error", "endpoint": endpoint, "type": type(e).__name__, "error": str(e)}))
+
+async def match_queries_async(specs):
+    results = await matcher.match_specs_async(specs)
+    for spec, result in zip(specs, results):
+        log_sample(spec, result["matches"], result["tier"])
+
+    return results
+
+match_batcher = MicroBatcher(
+    match_queries_async,
+    max_batch_size = BATCH_MAX_SIZE,
+    max_wait_ms = BATCH_WINDOW_MS,
+    max_concurrent_batches = MAX_CONCURRENT_BATCHES
+)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Startup runs in the background so /healthz answers while the model loads;
+    # /readyz only turns healthy once every phase, including warm-up, is done.
+    log_listener.start()
+    startup_task = asyncio.create_task(startup())
+    yield
+    startup_task.cancel()
+    await match_batcher.stop()
+    await matcher.aclose()
+    encode_executor.shutdown(wait = False)
+    log_listener.stop()
+
+app = FastAPI(lifespan = lifespan)
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    status_code = 200 if startup_state["ready"] else 503
+    return JSONResponse(status_code = status_code, content = startup_state)
 
 @app.post("/match")
-def match(payload: dict):
+async def match(payload: dict, request: Request):
     query = payload.get("query", "").strip()
     if not query:
         return {"matches" : []}
-    
+
+    require_ready()
+
     try:
-        vector = model.encode(query, normalize_embeddings = True).tolist()
-
-        results = client.query_points(
-            collection_name = COLLECTION,
-            query = vector,
-            with_payload = True,
-            limit = 3,
-            search_params = {
-                "hnsw_ef": EF_SEARCH
-            }
-        ).points
-
-        matches = []
-        for r in results:
-            if r.score < SIM_THRESHOLD:
-                continue
-
-            print(r.payload)
-            matches.append({
-                "troubleshooter_id" : r.payload.get("troubleshooter_id"),
-                "ps_command_id": r.payload.get("ps_command_id"),
-                "name" : r.payload.get("name"),
-                "score" : r.score
-            })
-        
-        return {"matches" : matches}
-    
-    except Exception as e:
-        print(f"[ERROR] - {e}")
\ No newline at end of file
+        spec = parse_query(payload)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code = 400, detail = str(e))
+
+    deadline = request_deadline(request)
+
+    try:
+        async with admission.admit(deadline):
+            IN_FLIGHT.inc()
+            try:
+                with REQUEST_SECONDS.time(endpoint = "/match"):
+                    result = await match_batcher.submit(spec, deadline)
+                return result
+
+            except Overloaded:
+                raise
+
+            except Exception as e:
+                log_error("/match", e)
+                raise HTTPException(status_code = 500, detail = "Matching failed")
+
+            finally:
+                IN_FLIGHT.dec()
+
+    except Overloaded as e:
+        raise shed("/match", e)
+
+@app.post("/match_batch")
+async def match_batch(payload: dict, request: Request):
+    queries = payload.get("queries") or []
+    if not isinstance(queries, list):
+        raise HTTPException(status_code = 400, detail = "'queries' must be a list")
+
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code = 400,
+            detail = f"At most {MAX_BATCH_QUERIES} queries are allowed per request"
+        )
+
+    require_ready()
+
+    try:
+        specs = [parse_query(item) for item in queries]
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code = 400, detail = str(e))
+
+    results = [{"query": spec["query"], "matches": []} for spec in specs]
+    pending = [i for i, spec in enumerate(specs) if spec["query"]]
+    if not pending:
+        return {"results" : results}
+
+    try:
+        async with admission.admit(request_deadline(request)):
+            IN_FLIGHT.inc()
+            try:
+                with REQUEST_SECONDS.time(endpoint = "/match_batch"):
+                    batch_matches = await match_queries_async([specs[i] for i in pending])
+            except Exception as e:
+                log_error("/match_batch", e)
+                raise HTTPException(status_code = 500, detail = "Batch matching failed")
+            finally:
+                IN_FLIGHT.dec()
+
+    except Overloaded as e:
+        raise shed("/match_batch", e)
+
+    for i, result in zip(pending, batch_matches):
+        results[i].update(result)
+
+    return {"results" : results}
+
+@app.post("/index/reload")
+async def reload_index():
+    if matcher.index_backend != "local" and matcher.retrieval_mode != "hierarchical":
+        raise HTTPException(status_code = 400, detail = "Neither the local index nor hierarchical retrieval is enabled")
+
+    require_ready()
+
+    return await asyncio.get_running_loop().run_in_executor(None, matcher.reload)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type = "text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    return matcher.cache_stats()
@@ -0,0 +1,102 @@
+import asyncio, time
+from admission import Overloaded
+
+
+class MicroBatcher:
+    # Collects items submitted from concurrent requests and hands them to the
+    # `process_batch` coroutine together, either once `max_batch_size` items are
+    # queued or `max_wait_ms` after the first item of the batch arrived. Up to
+    # `max_concurrent_batches` batches are processed at the same time so one
+    # batch can be encoding while the previous one waits on the vector store.
+    # Items whose client deadline (epoch seconds) has passed by the time their
+    # batch gets a processing slot are failed with Overloaded("deadline") instead
+    # of being encoded.
+
+    def __init__(self, process_batch, max_batch_size = 32, max_wait_ms = 5.0, max_concurrent_batches = 2):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_concurrent_batches = max(1, int(max_concurrent_batches))
+        self._queue = None
+        self._slots = None
+        self._worker = None
+        self._tasks = set()
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._queue = self._queue or asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, *self._tasks, return_exceptions = True)
+            self._worker = None
+
+    async def submit(self, item, deadline = None):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, deadline))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - asyncio.get_running_loop().time()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+
+        return batch
+
+    def _live(self, batch):
+        now = time.time()
+        live = []
+        for item, future, expires in batch:
+            if future.done():
+                continue
+            if expires is not None and expires <= now:
+                future.set_exception(Overloaded("deadline"))
+                continue
+            live.append((item, future))
+
+        return live
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+
+            await self._slots.acquire()
+            batch = self._live(batch)
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = asyncio.get_running_loop().create_task(self._process(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, batch):
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+
+        try:
+            results = await self.process_batch(items)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,157 @@
+import os, sys, json, time, argparse
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct, QuantizationSearchParams, SearchParams
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "setup"))
+from encoders import catalog_texts, load_encoder
+from init_qdrant import HNSW_M, create_collection
+
+load_dotenv()
+
+# name -> (quantization, product compression, original vectors on disk)
+CONFIGS = {
+    "float32": ("none", None, False),
+    "float32-on-disk": ("none", None, True),
+    "scalar-int8": ("scalar", None, False),
+    "scalar-int8-on-disk": ("scalar", None, True),
+    "product-x16-on-disk": ("product", "x16", True),
+    "product-x32-on-disk": ("product", "x32", True)
+}
+
+
+def normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis = 1, keepdims = True)
+
+
+def synthetic_corpus(base, n, noise, seed = 7):
+    # Grows the real catalog embeddings into an n-vector corpus of noisy copies,
+    # which keeps the clustered structure of real data at production scale.
+    rng = np.random.default_rng(seed)
+    picks = base[rng.integers(0, len(base), n)]
+    return normalize(picks + rng.normal(0, noise, picks.shape)).astype(np.float32)
+
+
+def estimate_ram_bytes(n, dim, quantization, compression, on_disk, m = HNSW_M):
+    # Resident memory Qdrant needs for the vectors and the HNSW graph; payloads,
+    # optimizer headroom and the page cache for on-disk vectors are excluded.
+    ram = n * m * 2 * 4
+    if not on_disk:
+        ram += n * dim * 4
+    if quantization == "scalar":
+        ram += n * dim
+    elif quantization == "product":
+        ram += n * dim * 4 / int(compression.lstrip("x"))
+    return int(ram)
+
+
+def wait_until_indexed(client, collection, expected_points = None, timeout = 600):
+    # Green alone can be reported before pending updates are applied, so the
+    # point count has to match as well. Measuring a partial corpus would make
+    # recall meaningless, hence the error instead of a silent return.
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        info = client.get_collection(collection)
+        if info.status.value == "green" and (expected_points is None or (info.points_count or 0) >= expected_points):
+            return
+        time.sleep(1)
+
+    raise TimeoutError(f"{collection} was not fully indexed after {timeout}s")
+
+
+def run_config(client, name, corpus, queries, truth, dim, oversampling, hnsw_ef, top_k):
+    quantization, compression, on_disk = CONFIGS[name]
+    collection = f"bench_{name.replace('-', '_')}_{dim}"
+    points = normalize(corpus[:, :dim])
+    query_vectors = normalize(queries[:, :dim])
+
+    if client.collection_exists(collection):
+        client.delete_collection(collection)
+
+    create_collection(
+        client, collection, size = dim, quantization = quantization,
+        on_disk = on_disk, pq_compression = compression or "x16"
+    )
+
+    try:
+        for start in range(0, len(points), 1024):
+            client.upsert(
+                collection_name = collection,
+                points = [
+                    PointStruct(id = start + i, vector = v.tolist())
+                    for i, v in enumerate(points[start:start + 1024])
+                ],
+                wait = True
+            )
+        wait_until_indexed(client, collection, expected_points = len(points))
+
+        params = SearchParams(
+            hnsw_ef = hnsw_ef,
+            quantization = QuantizationSearchParams(rescore = True, oversampling = oversampling) if quantization != "none" else None
+        )
+
+        hits, latencies = 0, []
+        for q, expected in zip(query_vectors, truth):
+            started = time.perf_counter()
+            result = client.query_points(collection_name = collection, query = q.tolist(), limit = top_k, search_params = params)
+            latencies.append(time.perf_counter() - started)
+            hits += len({p.id for p in result.points} & set(expected))
+
+        # Computed from vector and graph sizes, not measured from the Qdrant process.
+        ram = estimate_ram_bytes(len(points), dim, quantization, compression, on_disk)
+        return {
+            "config": name,
+            "dim": dim,
+            "vectors": len(points),
+            f"recall@{top_k}": round(hits / (len(truth) * top_k), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+            "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 2),
+            "est_ram_mb_per_100k": round(ram / len(points) * 100000 / 2**20, 1)
+        }
+    finally:
+        client.delete_collection(collection)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Estimated memory per 100k vectors vs recall for Qdrant quantization settings")
+    parser.add_argument("--vectors", type = int, default = 100000)
+    parser.add_argument("--queries", type = int, default = 200)
+    parser.add_argument("--noise", type = float, default = 0.05)
+    parser.add_argument("--dims", default = "768", help = "comma separated, e.g. 768,384,256")
+    parser.add_argument("--configs", default = ",".join(CONFIGS))
+    parser.add_argument("--oversampling", type = float, default = 2.0)
+    parser.add_argument("--hnsw-ef", type = int, default = 128)
+    parser.add_argument("--top-k", type = int, default = 3)
+    parser.add_argument("--catalog", default = os.path.join(ROOT, "troubleshooters.json"))
+    parser.add_argument("--json", help = "also write the results to this file")
+    args = parser.parse_args()
+
+    model = load_encoder(os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2"), os.getenv("ENCODER_BACKEND", "torch"))
+    base = model.encode(catalog_texts(args.catalog), normalize_embeddings = True)
+
+    corpus = synthetic_corpus(base, args.vectors, args.noise)
+    queries = synthetic_corpus(base, args.queries, args.noise, seed = 11)
+
+    # Ground truth is exact top-k over the full-dimensional vectors, so reduced
+    # dimensions are scored against what the uncompressed index would return.
+    scores = queries @ corpus.T
+    truth = np.argsort(-scores, axis = 1)[:, :args.top_k].tolist()
+
+    client = QdrantClient(host = os.getenv("QDRANT_HOST", "localhost"), port = int(os.getenv("QDRANT_PORT", 6333)))
+    results = []
+    for dim in [int(d) for d in args.dims.split(",")]:
+        for name in args.configs.split(","):
+            result = run_config(client, name, corpus, queries, truth, dim, args.oversampling, args.hnsw_ef, args.top_k)
+            results.append(result)
+            print(" | ".join(f"{k}={v}" for k, v in result.items()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent = 4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import os, sys, json, time, argparse, subprocess
+import numpy as np
+import yaml
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct, QuantizationSearchParams, SearchParams
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "setup"))
+from cache import normalize_query
+from encoders import BACKENDS, load_encoder
+from init_qdrant import create_collection, is_indexable, troubleshooter_text
+from local_index import LocalIndex
+from quantization import wait_until_indexed
+from sources import open_source
+
+load_dotenv()
+
+NLU_PATH = os.path.join(os.path.dirname(ROOT), "rasa_bot", "data", "nlu.yml")
+LABELS_PATH = os.path.join(BENCHMARKS, "labels.json")
+
+# Fields that identify a configuration; results from two runs are compared on them.
+CONFIG_FIELDS = ("model", "backend", "index", "quantization", "hnsw_ef")
+
+
+def labeled_queries(nlu_path, labels_path, intent = "report_issue"):
+    # Every NLU example of `intent` that has an entry in labels.json, which maps
+    # a query to the leaf troubleshooter_ids that are acceptable answers.
+    # Categories are never labeled because they cannot be run. Examples with no
+    # matching troubleshooter (Teams, VPN, OneDrive, ...) are deliberately left
+    # out of labels.json.
+    with open(nlu_path, encoding = "utf-8") as f:
+        nlu = yaml.safe_load(f)
+    with open(labels_path, encoding = "utf-8") as f:
+        labels = {normalize_query(q): set(ids) for q, ids in json.load(f).items()}
+
+    examples = []
+    for block in nlu.get("nlu", []):
+        if block.get("intent") == intent:
+            examples += [
+                line.strip()[2:].strip()
+                for line in block.get("examples", "").splitlines()
+                if line.strip().startswith("- ")
+            ]
+
+    queries = [(q, labels[normalize_query(q)]) for q in examples if normalize_query(q) in labels]
+
+    stale = set(labels) - {normalize_query(q) for q in examples}
+    if stale:
+        print(f"[WARNING] - {len(stale)} labeled queries no longer appear in {nlu_path}: {sorted(stale)}")
+
+    return queries
+
+
+def first_relevant_rank(ids, relevant):
+    for rank, point_id in enumerate(ids, 1):
+        if point_id in relevant:
+            return rank
+    return None
+
+
+def evaluate(model, queries, search, top_k, threshold, repeat, category_ids = ()):
+    # Latency is measured per query end to end (encode + search), the way a
+    # single /match call pays for it. Quality is taken from the first pass.
+    for text, _ in queries[:2]:
+        search(model.encode(text, normalize_embeddings = True))
+
+    ranks, answered, correct, category_top, latencies = [], 0, 0, 0, []
+    started = time.perf_counter()
+
+    for attempt in range(repeat):
+        for text, relevant in queries:
+            query_started = time.perf_counter()
+            hits = search(model.encode(text, normalize_embeddings = True))
+            latencies.append(time.perf_counter() - query_started)
+
+            if attempt:
+                continue
+
+            ranks.append(first_relevant_rank([point_id for point_id, _ in hits], relevant))
+            category_top += bool(hits) and hits[0][0] in category_ids
+            if hits and hits[0][1] >= threshold:
+                answered += 1
+                correct += hits[0][0] in relevant
+
+    elapsed = time.perf_counter() - started
+
+    # With several acceptable answers per query, recall@k is the share of queries
+    # with at least one of them in the top k. category@1 is the share whose top
+    # hit is a category node, which scores as a miss everywhere else.
+    return {
+        f"recall@{top_k}": round(sum(r is not None for r in ranks) / len(ranks), 4),
+        "recall@1": round(sum(r == 1 for r in ranks) / len(ranks), 4),
+        "mrr": round(sum(1 / r for r in ranks if r) / len(ranks), 4),
+        "answered": round(answered / len(ranks), 4),
+        "precision@1": round(correct / answered, 4) if answered else 0.0,
+        "category@1": round(category_top / len(ranks), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 2),
+        "qps": round(len(latencies) / elapsed, 1)
+    }
+
+
+def qdrant_search(client, collection, hnsw_ef, quantization, top_k):
+    params = SearchParams(
+        hnsw_ef = hnsw_ef,
+        quantization = QuantizationSearchParams(rescore = True, oversampling = 2.0) if quantization != "none" else None
+    )
+
+    def search(vector):
+        result = client.query_points(
+            collection_name = collection, query = vector.tolist(), limit = top_k, search_params = params
+        )
+        return [(p.id, p.score) for p in result.points]
+
+    return search
+
+
+def local_search(index, top_k):
+    def search(vector):
+        return [(hit.id, hit.score) for hit in index.search(vector[None, :], top_k)[0]]
+
+    return search
+
+
+def build_collection(client, collection, catalog, vectors, quantization):
+    if client.collection_exists(collection):
+        client.delete_collection(collection)
+
+    create_collection(client, collection, size = vectors.shape[1], quantization = quantization, on_disk = False)
+    client.upsert(
+        collection_name = collection,
+        points = [
+            PointStruct(
+                id = int(t["troubleshooter_id"]),
+                vector = v.tolist(),
+                payload = {"troubleshooter_id": t["troubleshooter_id"], "parent_id": t.get("parent_id") or 0}
+            )
+            for t, v in zip(catalog, vectors)
+        ],
+        wait = True
+    )
+    wait_until_indexed(client, collection, expected_points = len(catalog))
+
+
+def git_commit():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd = ROOT, capture_output = True, text = True, check = True
+        )
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results):
+    columns = list(results[0])
+    rows = [["-" if r.get(c) is None else str(r.get(c)) for c in columns] for r in results]
+    widths = [max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(columns)]
+
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def regressions(results, baseline, top_k, max_recall_drop, max_p95_increase):
+    # Quality must not drop by more than `max_recall_drop` (absolute) and p95 must
+    # not grow by more than `max_p95_increase` (relative). Latency is only
+    # comparable between runs on the same machine.
+    previous = {tuple(r.get(f) for f in CONFIG_FIELDS): r for r in baseline["results"]}
+    found = []
+
+    for r in results:
+        key = tuple(r.get(f) for f in CONFIG_FIELDS)
+        before = previous.get(key)
+        if before is None:
+            continue
+
+        for metric in (f"recall@{top_k}", "mrr"):
+            if metric in before and before[metric] - r[metric] > max_recall_drop:
+                found.append(f"{key}: {metric} {before[metric]} -> {r[metric]}")
+
+        if before.get("p95_ms") and r["p95_ms"] > before["p95_ms"] * (1 + max_p95_increase):
+            found.append(f"{key}: p95_ms {before['p95_ms']} -> {r['p95_ms']}")
+
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Retrieval quality vs latency for model, backend, ef, quantization and index mode")
+    parser.add_argument("--models", default = os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2"), help = "comma separated")
+    parser.add_argument("--backends", default = "torch", help = f"comma separated, any of {','.join(BACKENDS)}")
+    parser.add_argument("--ef", default = "32,64,128,256", help = "comma separated hnsw_ef values")
+    parser.add_argument("--quantization", default = "none,scalar", help = "comma separated, any of none,scalar,product")
+    parser.add_argument("--index", default = "qdrant,local", help = "comma separated, any of qdrant,local")
+    parser.add_argument("--top-k", type = int, default = 3)
+    parser.add_argument("--threshold", type = float, default = 0.25, help = "SIM_THRESHOLD used for answered/precision@1")
+    parser.add_argument("--repeat", type = int, default = 5, help = "passes over the query set for latency")
+    parser.add_argument("--catalog", default = os.path.join(ROOT, "troubleshooters.json"))
+    parser.add_argument("--nlu", default = NLU_PATH)
+    parser.add_argument("--labels", default = LABELS_PATH)
+    parser.add_argument("--json", help = "also write the results to this file")
+    parser.add_argument("--baseline", help = "results JSON from an earlier run; exit 1 on regressions")
+    parser.add_argument("--max-recall-drop", type = float, default = 0.02)
+    parser.add_argument("--max-p95-increase", type = float, default = 0.25)
+    args = parser.parse_args()
+
+    queries = labeled_queries(args.nlu, args.labels)
+    catalog = [t for t in open_source(args.catalog) if is_indexable(t)]
+    category_ids = {int(t["troubleshooter_id"]) for t in catalog if not t.get("parent_id")}
+
+    labeled_categories = set().union(*(relevant for _, relevant in queries)) & category_ids
+    if labeled_categories:
+        print(f"[WARNING] - ignoring category ids in {args.labels}: {sorted(labeled_categories)}")
+        queries = [(q, relevant - category_ids) for q, relevant in queries]
+    indexes = args.index.split(",")
+    print(f"[BENCHMARK] - {len(queries)} labeled queries against {len(catalog)} troubleshooters")
+
+    client = QdrantClient(host = os.getenv("QDRANT_HOST", "localhost"), port = int(os.getenv("QDRANT_PORT", 6333)))
+    results = []
+
+    for model_name in args.models.split(","):
+        for backend in args.backends.split(","):
+            model = load_encoder(model_name, backend)
+            vectors = np.asarray(model.encode(
+                [troubleshooter_text(t) for t in catalog], normalize_embeddings = True, batch_size = 64
+            ))
+
+            for n, quantization in enumerate(args.quantization.split(",")):
+                collection = f"bench_retrieval_{quantization}"
+                build_collection(client, collection, catalog, vectors, quantization)
+
+                runs = []
+                if "qdrant" in indexes:
+                    runs += [
+                        (("qdrant", quantization, ef), qdrant_search(client, collection, ef, quantization, args.top_k))
+                        for ef in [int(e) for e in args.ef.split(",")]
+                    ]
+                # The local index always holds the original vectors, so it only
+                # needs one run per encoder.
+                if "local" in indexes and n == 0:
+                    runs.append((("local", None, None), local_search(LocalIndex(client, collection).load(), args.top_k)))
+
+                try:
+                    for (index, quant, ef), search in runs:
+                        result = {"model": model_name, "backend": backend, "index": index, "quantization": quant, "hnsw_ef": ef}
+                        result.update(evaluate(model, queries, search, args.top_k, args.threshold, args.repeat, category_ids))
+                        results.append(result)
+                        print(" | ".join(f"{k}={v}" for k, v in result.items()))
+                finally:
+                    client.delete_collection(collection)
+
+    print()
+    print_table(results)
+
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "queries": len(queries),
+        "catalog": len(catalog),
+        "top_k": args.top_k,
+        "threshold": args.threshold,
+        "results": results
+    }
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent = 4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        found = regressions(results, baseline, args.top_k, args.max_recall_drop, args.max_p95_increase)
+        for line in found:
+            print(f"[REGRESSION] - {line}")
+        if found:
+            sys.exit(1)
+        print(f"[BENCHMARK] - no regressions against {baseline.get('commit')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import threading, time
+from collections import OrderedDict
+
+
+def normalize_query(text):
+    return " ".join(str(text).lower().split())
+
+
+class EmbeddingCache:
+    # Bounded LRU cache of query embeddings keyed by normalized query text.
+    # Entries older than `ttl_seconds` are treated as misses (0 disables the TTL)
+    # and the whole cache is dropped whenever the model it was built for changes.
+
+    def __init__(self, max_size = 10000, ttl_seconds = 0, model_name = None):
+        self.max_size = max(0, int(max_size))
+        self.ttl_seconds = max(0.0, float(ttl_seconds))
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set_model(self, model_name):
+        with self._lock:
+            if model_name != self.model_name:
+                self._entries.clear()
+                self.model_name = model_name
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, text):
+        key = normalize_query(text)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, stored_at = entry
+                if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, text, vector):
+        if not self.max_size:
+            return
+
+        key = normalize_query(text)
+
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic())
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last = False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,195 @@
+import fcntl, hashlib, json, os, re, threading, time
+from contextlib import contextmanager
+import numpy as np
+
+
+def text_hash(text):
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+
+
+def store_slug(encoder):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", encoder)
+
+
+class EmbeddingStore:
+    # Append-only on-disk embedding store for one encoder (model + backend).
+    # Vectors live in a raw float32 file that is read through np.memmap, and row i
+    # belongs to the text hash on line i of keys.txt. Vectors are always written
+    # before their keys, so a reader that sees a key can also read its vector, and
+    # readers pick up rows appended by another process on their next refresh.
+    # Writers in any number of processes (uvicorn workers, init_qdrant.py) take
+    # an exclusive flock on the directory and catch up on the others' keys before
+    # appending, and new row numbers come from the size of the vector file. The
+    # store only grows; `max_rows` caps it (further puts are dropped) and readers
+    # keep every key in memory, so set it for stores fed by query traffic.
+
+    def __init__(self, root, encoder, writable = True, refresh_seconds = 5.0, max_rows = None):
+        self.encoder = encoder
+        self.path = os.path.join(root, store_slug(encoder))
+        self.writable = writable
+        self.refresh_seconds = refresh_seconds
+        self.max_rows = max_rows
+        self.lock_path = os.path.join(self.path, "write.lock")
+        self.meta_path = os.path.join(self.path, "meta.json")
+        self.keys_path = os.path.join(self.path, "keys.txt")
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.dim = None
+        self.hits = 0
+        self.misses = 0
+        self._rows = {}
+        self._count = 0
+        self._keys_offset = 0
+        self._vectors = None
+        self._last_refresh = 0.0
+        self._full = False
+        self._lock = threading.Lock()
+
+        if writable:
+            os.makedirs(self.path, exist_ok = True)
+
+        self.refresh(force = True)
+
+    def __len__(self):
+        return self._count
+
+    @contextmanager
+    def _write_lock(self):
+        # flock is held per open file, so this also serializes threads of one process.
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _truncate_orphans(self):
+        # A crash between writing vectors and keys leaves vector rows without
+        # keys. Only called with the write lock held.
+        if self.dim and os.path.exists(self.vectors_path):
+            expected = self._count * self.dim * 4
+            if os.path.getsize(self.vectors_path) > expected:
+                with open(self.vectors_path, "r+b") as f:
+                    f.truncate(expected)
+
+    def refresh(self, force = False):
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_seconds:
+            return
+        self._last_refresh = now
+
+        if self.dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.dim = json.load(f)["dim"]
+
+        # The offset check, read and update happen under one lock hold, so two
+        # threads refreshing at once (or a refresh racing put_many) never count
+        # the same keys twice.
+        with self._lock:
+            if not os.path.exists(self.keys_path) or os.path.getsize(self.keys_path) == self._keys_offset:
+                return
+
+            with open(self.keys_path, "rb") as f:
+                f.seek(self._keys_offset)
+                data = f.read()
+
+            complete = data[:data.rfind(b"\n") + 1]
+            for key in complete.decode("ascii").splitlines():
+                self._rows.setdefault(key, self._count)
+                self._count += 1
+            self._keys_offset += len(complete)
+            self._vectors = None
+
+    def _matrix(self):
+        if self._vectors is None and self._count:
+            self._vectors = np.memmap(self.vectors_path, dtype = np.float32, mode = "r", shape = (self._count, self.dim))
+        return self._vectors
+
+    def get_many(self, hashes):
+        self.refresh()
+
+        with self._lock:
+            matrix = self._matrix()
+            results = []
+            for h in hashes:
+                row = self._rows.get(h)
+                results.append(None if row is None else np.array(matrix[row]))
+
+        found = sum(r is not None for r in results)
+        self.hits += found
+        self.misses += len(results) - found
+        return results
+
+    def put_many(self, hashes, vectors):
+        if not self.writable or self._full:
+            return
+
+        vectors = np.asarray(vectors, dtype = np.float32)
+
+        with self._write_lock():
+            # Another writer may have appended since our last refresh; read its
+            # keys so rows it already stored are skipped and ours go after them.
+            self.refresh(force = True)
+
+            with self._lock:
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                    with open(self.meta_path, "w") as f:
+                        json.dump({"encoder": self.encoder, "dim": self.dim}, f)
+
+                new_rows, new_keys, seen = [], [], set()
+                for h, vector in zip(hashes, vectors):
+                    if h in self._rows or h in seen:
+                        continue
+                    seen.add(h)
+                    new_rows.append(vector)
+                    new_keys.append(h)
+
+                if self.max_rows is not None and self._count + len(new_keys) > self.max_rows:
+                    new_keys = new_keys[:max(0, self.max_rows - self._count)]
+                    new_rows = new_rows[:len(new_keys)]
+                    self._full = True
+                    print(f"[EMBEDDING STORE] - {self.path} reached {self.max_rows} rows, no longer adding vectors")
+
+                if not new_keys:
+                    return
+
+                self._truncate_orphans()
+                row_bytes = self.dim * 4
+                start = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+                if start != self._count:
+                    raise RuntimeError(f"{self.path} has {start} vectors for {self._count} keys")
+
+                with open(self.vectors_path, "ab") as f:
+                    f.write(np.ascontiguousarray(new_rows, dtype = np.float32).tobytes())
+
+                data = ("\n".join(new_keys) + "\n").encode("ascii")
+                with open(self.keys_path, "ab") as f:
+                    f.write(data)
+
+                for row, h in enumerate(new_keys, start):
+                    self._rows[h] = row
+                self._count = start + len(new_keys)
+                self._keys_offset += len(data)
+                self._vectors = None
+
+    def encode(self, texts, encode_fn, write = True):
+        # Read-through: only texts missing from the store reach `encode_fn`.
+        hashes = [text_hash(t) for t in texts]
+        vectors = self.get_many(hashes)
+        missing = {}
+        for i, v in enumerate(vectors):
+            if v is None:
+                missing.setdefault(hashes[i], []).append(i)
+
+        if missing:
+            encoded = encode_fn([texts[positions[0]] for positions in missing.values()])
+            for positions, vector in zip(missing.values(), encoded):
+                for i in positions:
+                    vectors[i] = np.asarray(vector, dtype = np.float32)
+            if write:
+                self.put_many(list(missing), encoded)
+
+        return np.asarray(vectors, dtype = np.float32).reshape(len(texts), -1)
+
+    def stats(self):
+        return {"encoder": self.encoder, "rows": self._count, "dim": self.dim, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,115 @@
+import argparse, json, os
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+# torch - fp32 PyTorch (the original setup)
+# onnx  - ONNX Runtime; ENCODER_ONNX_FILE can point at a quantized export such as
+#         onnx/model_qint8_avx512_vnni.onnx
+# int8  - PyTorch with every nn.Linear dynamically quantized to int8
+BACKENDS = ("torch", "onnx", "int8")
+
+
+def encoder_id(model_name, backend, onnx_file = None, dim = None):
+    parts = [model_name, backend]
+    if backend == "onnx" and onnx_file:
+        parts.append(onnx_file)
+    if dim:
+        parts.append(f"d{dim}")
+    return ":".join(parts)
+
+
+def embedding_space(encoder):
+    # Backends of one model produce interchangeable vectors; a different model or
+    # truncated dimension does not. "<model>:<backend>[:<onnx file>][:d<dim>]"
+    # -> (model, dim).
+    parts = encoder.split(":")
+    dim = parts[-1] if len(parts) > 2 and parts[-1][:1] == "d" and parts[-1][1:].isdigit() else None
+    return parts[0], dim
+
+
+def load_encoder(model_name, backend = "torch", onnx_file = None, dim = None, **kwargs):
+    # `dim` truncates embeddings to their first `dim` components (re-normalized
+    # by encode(normalize_embeddings = True)) to shrink the index.
+    backend = (backend or "torch").lower()
+    if dim:
+        kwargs["truncate_dim"] = int(dim)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+    if backend == "onnx":
+        try:
+            import onnxruntime
+
+            # ONNX Runtime would start one intra-op thread per core in every
+            # session; it gets the same per-worker budget torch was given
+            # (TORCH_NUM_THREADS in app.py) so workers don't oversubscribe the CPU.
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = torch.get_num_threads()
+            session_options.inter_op_num_threads = 1
+            model_kwargs = {"session_options": session_options}
+            if onnx_file:
+                model_kwargs["file_name"] = onnx_file
+
+            return SentenceTransformer(model_name, backend = "onnx", device = "cpu", model_kwargs = model_kwargs, **kwargs)
+        except ImportError as e:
+            raise RuntimeError("The onnx encoder backend needs `pip install optimum[onnxruntime]`") from e
+
+    model = SentenceTransformer(model_name, device = "cpu", **kwargs)
+
+    if backend == "int8":
+        transformer = model[0]
+        transformer.auto_model = torch.ao.quantization.quantize_dynamic(
+            transformer.auto_model, {torch.nn.Linear}, dtype = torch.qint8
+        )
+
+    return model
+
+
+def parity_check(model_name, backend, texts, onnx_file = None, batch_size = 32):
+    reference = load_encoder(model_name, "torch").encode(
+        texts, normalize_embeddings = True, batch_size = batch_size
+    )
+    candidate = load_encoder(model_name, backend, onnx_file).encode(
+        texts, normalize_embeddings = True, batch_size = batch_size
+    )
+
+    cosine = np.sum(np.asarray(reference) * np.asarray(candidate), axis = 1)
+    drift = 1.0 - cosine
+
+    return {
+        "model": model_name,
+        "backend": encoder_id(model_name, backend, onnx_file),
+        "texts": len(texts),
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "mean_drift": float(drift.mean()),
+        "max_drift": float(drift.max())
+    }
+
+
+def catalog_texts(path):
+    with open(path) as f:
+        items = json.load(f)
+
+    return [
+        f"{t.get('name', '')} {t.get('description', '')}".strip()
+        for t in items
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Report cosine drift of an encoder backend against fp32 PyTorch")
+    parser.add_argument("--model", default = os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2"))
+    parser.add_argument("--backend", default = os.getenv("ENCODER_BACKEND", "int8"), choices = BACKENDS)
+    parser.add_argument("--onnx-file", default = os.getenv("ENCODER_ONNX_FILE"))
+    parser.add_argument(
+        "--catalog",
+        default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "troubleshooters.json")
+    )
+    args = parser.parse_args()
+
+    print(json.dumps(
+        parity_check(args.model, args.backend, catalog_texts(args.catalog), args.onnx_file),
+        indent = 4
+    ))
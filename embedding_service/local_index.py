@@ -0,0 +1,211 @@
+import hashlib, json, os, threading
+from collections import namedtuple
+import numpy as np
+
+LocalHit = namedtuple("LocalHit", ["id", "score", "payload"])
+
+
+def normalize_rows(matrix):
+    matrix = np.ascontiguousarray(matrix, dtype = np.float32)
+    norms = np.linalg.norm(matrix, axis = 1, keepdims = True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class LocalIndex:
+    # Exact in-process cosine search over a small collection. All vectors live in
+    # one contiguous, L2-normalized float32 matrix so a batch of queries is a single
+    # matrix product followed by argpartition.
+
+    def __init__(self, client, collection, snapshot_path = None, scroll_batch_size = 256):
+        self.client = client
+        self.collection = collection
+        self.snapshot_path = snapshot_path
+        self.scroll_batch_size = scroll_batch_size
+        self.ids = []
+        self.payloads = []
+        self.matrix = np.zeros((0, 0), dtype = np.float32)
+        self.fingerprint = None
+        # Called after every reload that changed the index (watcher or manual).
+        self.on_reload = None
+        self._columns = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def fetch_collection(self):
+        ids, payloads, vectors = [], [], []
+        offset = None
+
+        while True:
+            points, offset = self.client.scroll(
+                collection_name = self.collection,
+                limit = self.scroll_batch_size,
+                offset = offset,
+                with_payload = True,
+                with_vectors = True
+            )
+
+            for p in points:
+                ids.append(p.id)
+                payloads.append(p.payload or {})
+                vectors.append(p.vector)
+
+            if offset is None:
+                break
+
+        return ids, payloads, vectors
+
+    @staticmethod
+    def fingerprint_of(ids, payloads, vectors):
+        digest = hashlib.sha1(json.dumps(
+            [list(map(str, ids)), payloads],
+            sort_keys = True,
+            default = str
+        ).encode())
+        digest.update(np.asarray(vectors, dtype = np.float32).tobytes())
+        return digest.hexdigest()
+
+    def snapshot_exists(self):
+        return bool(self.snapshot_path) and os.path.exists(self.snapshot_path + ".json")
+
+    def swap(self, ids, payloads, vectors, fingerprint = None):
+        if len(vectors):
+            matrix = normalize_rows(np.asarray(vectors, dtype = np.float32))
+        else:
+            matrix = np.zeros((0, 0), dtype = np.float32)
+
+        with self._lock:
+            self.ids = list(ids)
+            self.payloads = list(payloads)
+            self.matrix = matrix
+            self.fingerprint = fingerprint
+            self._columns = {}
+
+    def load(self, ids = None, payloads = None, vectors = None):
+        # The live collection is always preferred. The snapshot is only a fallback
+        # for starting while Qdrant is unreachable; it is rewritten after every
+        # successful load and carries the collection fingerprint, so the watcher
+        # still notices when the collection changes afterwards.
+        if ids is None:
+            try:
+                ids, payloads, vectors = self.fetch_collection()
+            except Exception as e:
+                if not self.snapshot_exists():
+                    raise
+                print(f"[LOCAL INDEX] - {self.collection} unavailable ({e}), loading snapshot {self.snapshot_path}")
+                self.load_snapshot(self.snapshot_path)
+                print(f"[LOCAL INDEX] - loaded {len(self)} vectors from snapshot")
+                return self
+
+        self.swap(ids, payloads, vectors, self.fingerprint_of(ids, payloads, vectors))
+        if self.snapshot_path:
+            self.save_snapshot(self.snapshot_path)
+
+        print(f"[LOCAL INDEX] - loaded {len(self)} vectors from {self.collection}")
+        return self
+
+    def save_snapshot(self, path):
+        with self._lock:
+            ids, payloads, matrix, fingerprint = self.ids, self.payloads, self.matrix, self.fingerprint
+
+        # Written to temporary files and renamed into place, so a reader (or a
+        # crash) never sees a half-written snapshot.
+        suffix = f".tmp{os.getpid()}"
+        with open(path + ".npy" + suffix, "wb") as f:
+            np.save(f, matrix)
+        with open(path + ".json" + suffix, "w") as f:
+            json.dump({"collection": self.collection, "fingerprint": fingerprint, "ids": ids, "payloads": payloads}, f)
+
+        os.replace(path + ".npy" + suffix, path + ".npy")
+        os.replace(path + ".json" + suffix, path + ".json")
+
+    def load_snapshot(self, path):
+        with open(path + ".json") as f:
+            meta = json.load(f)
+
+        matrix = np.load(path + ".npy", mmap_mode = "r")
+        if len(matrix) != len(meta["ids"]):
+            raise ValueError(f"Snapshot {path} is inconsistent: {len(matrix)} vectors for {len(meta['ids'])} ids")
+
+        self.swap(meta["ids"], meta["payloads"], matrix, meta.get("fingerprint"))
+
+    def reload_if_changed(self):
+        ids, payloads, vectors = self.fetch_collection()
+        if self.fingerprint_of(ids, payloads, vectors) == self.fingerprint:
+            return False
+
+        self.load(ids, payloads, vectors)
+        if self.on_reload is not None:
+            self.on_reload()
+        return True
+
+    def watch(self, interval_seconds):
+        if interval_seconds <= 0 or self._watcher is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval_seconds):
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    print(f"[LOCAL INDEX ERROR] - {e}")
+
+        self._watcher = threading.Thread(target = run, name = "local-index-watcher", daemon = True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def contents(self):
+        with self._lock:
+            return self.ids, self.payloads, self.matrix
+
+    def payload_mask(self, key, values):
+        # Boolean row mask for `payload[key] in values`, backed by a per-key
+        # column array that is built once per loaded matrix.
+        with self._lock:
+            column = self._columns.get(key)
+            if column is None:
+                column = np.array([p.get(key) for p in self.payloads], dtype = object)
+                self._columns[key] = column
+
+        return np.isin(column, list(values))
+
+    def search(self, vectors, top_k, masks = None):
+        with self._lock:
+            ids, payloads, matrix = self.ids, self.payloads, self.matrix
+
+        queries = np.atleast_2d(np.asarray(vectors, dtype = np.float32))
+        top_ks = [top_k] * len(queries) if isinstance(top_k, int) else list(top_k)
+
+        if not len(ids):
+            return [[] for _ in queries]
+
+        scores = queries @ matrix.T
+        if masks is not None:
+            for row, mask in enumerate(masks):
+                if mask is not None:
+                    scores[row, ~mask] = -np.inf
+
+        k = min(max(top_ks), len(ids))
+
+        if k < len(ids):
+            candidates = np.argpartition(-scores, k - 1, axis = 1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(len(ids)), (len(queries), len(ids)))
+
+        results = []
+        for row, (row_candidates, limit) in enumerate(zip(candidates, top_ks)):
+            row_scores = scores[row, row_candidates]
+            order = np.argsort(-row_scores)[:limit]
+            results.append([
+                LocalHit(ids[row_candidates[i]], float(row_scores[i]), payloads[row_candidates[i]])
+                for i in order
+                if np.isfinite(row_scores[i])
+            ])
+
+        return results
@@ -0,0 +1,627 @@
+import asyncio, os, threading, time
+from dotenv import load_dotenv
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import (
+    FieldCondition, Filter, MatchAny, MatchValue, QuantizationSearchParams, QueryRequest, SearchParams
+)
+import numpy as np
+from cache import EmbeddingCache, normalize_query
+from embedding_store import EmbeddingStore
+from encoders import encoder_id, load_encoder
+from local_index import LocalIndex
+from metrics import Registry, SIZE_BUCKETS
+
+load_dotenv()
+
+# With blue/green rebuilds this is an alias that init_qdrant.py --rebuild
+# switches atomically between versioned collections.
+COLLECTION = os.getenv("QDRANT_COLLECTION", "troubleshooters")
+SIM_THRESHOLD = 0.25
+TOP_K = 3
+EF_SEARCH = 128
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2")
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch").lower()
+ENCODER_ONNX_FILE = os.getenv("ENCODER_ONNX_FILE")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 0)) or None
+MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH")
+QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
+QDRANT_PORT = int(os.getenv("QDRANT_PORT", 6333))
+QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()
+QUANTIZATION_RESCORE = os.getenv("QDRANT_RESCORE", "true").lower() == "true"
+QUANTIZATION_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", 2.0))
+STARTUP_RETRY_SECONDS = float(os.getenv("STARTUP_RETRY_SECONDS", 5))
+WARMUP_QUERIES = ["outlook not working", "wifi is slow", "printer is not printing", "reset my password"]
+BATCH_MAX_SIZE = int(os.getenv("MATCH_BATCH_MAX_SIZE", 32))
+MAX_TOP_K = int(os.getenv("MATCH_MAX_TOP_K", 50))
+QDRANT_BATCH_SIZE = int(os.getenv("QDRANT_BATCH_SIZE", 256))
+CACHE_MAX_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", 0))
+INDEX_BACKEND = os.getenv("INDEX_BACKEND", "qdrant").lower()
+LOCAL_INDEX_SNAPSHOT = os.getenv("LOCAL_INDEX_SNAPSHOT")
+LOCAL_INDEX_REFRESH_SECONDS = float(os.getenv("LOCAL_INDEX_REFRESH_SECONDS", 60))
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR")
+EMBEDDING_STORE_WRITE_QUERIES = os.getenv("EMBEDDING_STORE_WRITE_QUERIES", "false").lower() == "true"
+EMBEDDING_STORE_MAX_ROWS = int(os.getenv("EMBEDDING_STORE_MAX_ROWS", 200000))
+FILTER_FIELDS = ("domain_id", "platform_id", "is_active", "user_view", "admin_view")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "flat").lower()
+HIERARCHY_TOP_CATEGORIES = int(os.getenv("HIERARCHY_TOP_CATEGORIES", 2))
+CATEGORY_REFRESH_SECONDS = float(os.getenv("CATEGORY_REFRESH_SECONDS", 60))
+
+# Cascade mode answers from a small encoder with its own collection first and
+# only escalates a query to the primary model when the fast tier's top score is
+# below CASCADE_MIN_SCORE or the top-1/top-2 gap is below CASCADE_MIN_MARGIN.
+# The fast collection is indexed by init_qdrant.py run with EMBEDDING_MODEL,
+# EMBEDDING_SIZE and QDRANT_COLLECTION pointed at it.
+CASCADE = os.getenv("MATCH_CASCADE", "false").lower() == "true"
+CASCADE_MODEL_NAME = os.getenv("CASCADE_MODEL", "all-MiniLM-L6-v2")
+CASCADE_ENCODER_BACKEND = os.getenv("CASCADE_ENCODER_BACKEND", ENCODER_BACKEND).lower()
+CASCADE_ONNX_FILE = os.getenv("CASCADE_ONNX_FILE")
+CASCADE_MODEL_PATH = os.getenv("CASCADE_MODEL_PATH")
+CASCADE_COLLECTION = os.getenv("CASCADE_COLLECTION", "troubleshooters_minilm")
+CASCADE_MIN_SCORE = float(os.getenv("CASCADE_MIN_SCORE", 0.55))
+CASCADE_MIN_MARGIN = float(os.getenv("CASCADE_MIN_MARGIN", 0.05))
+
+
+class Tier:
+    # One encoder together with the collection (and optional local/category
+    # indexes) built with it. Without cascade mode there is only the primary tier.
+
+    def __init__(self, name, model_name, collection, backend, onnx_file = None, model_path = None, dim = None, snapshot_path = None):
+        self.name = name
+        self.model_name = model_name
+        self.collection = collection
+        self.backend = backend
+        self.onnx_file = onnx_file
+        self.model_path = model_path
+        self.dim = dim
+        self.snapshot_path = snapshot_path
+        self.encoder = encoder_id(model_name, backend, onnx_file, dim)
+        self.model = None
+        self.local_index = None
+        self.category_index = None
+        self.category_fingerprint = None
+        self.cache = EmbeddingCache(max_size = CACHE_MAX_SIZE, ttl_seconds = CACHE_TTL_SECONDS, model_name = self.encoder)
+        self.store = None
+        if EMBEDDING_STORE_DIR:
+            self.store = EmbeddingStore(
+                EMBEDDING_STORE_DIR,
+                self.encoder,
+                writable = EMBEDDING_STORE_WRITE_QUERIES,
+                max_rows = EMBEDDING_STORE_MAX_ROWS
+            )
+
+
+def to_matches(points, threshold = SIM_THRESHOLD):
+    matches = []
+    for r in points:
+        if r.score < threshold:
+            continue
+
+        matches.append({
+            "troubleshooter_id" : r.payload.get("troubleshooter_id"),
+            "ps_command_id": r.payload.get("ps_command_id"),
+            "name" : r.payload.get("name"),
+            "score" : r.score
+        })
+
+    return matches
+
+
+def filter_value(key, value):
+    # Validated here, per request, because a value Qdrant rejects would otherwise
+    # fail the whole micro-batch it was grouped with.
+    if isinstance(value, (bool, int, str)):
+        return value
+
+    if isinstance(value, list) and value:
+        if all(isinstance(v, str) for v in value):
+            return value
+        if all(isinstance(v, int) and not isinstance(v, bool) for v in value):
+            return value
+
+    raise ValueError(
+        f"Filter '{key}' must be an int, string or bool, or a non-empty list of only ints or only strings"
+    )
+
+
+def parse_query(item):
+    if isinstance(item, str):
+        item = {"query": item}
+
+    if not isinstance(item, dict):
+        raise ValueError("Each query must be a string or an object with a 'query' field")
+
+    top_k = int(item.get("top_k") or TOP_K)
+    threshold = item.get("threshold")
+    hnsw_ef = item.get("hnsw_ef")
+
+    filters = item.get("filters") or {}
+    if not isinstance(filters, dict):
+        raise ValueError("'filters' must be an object")
+
+    unknown = set(filters) - set(FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unsupported filter fields: {', '.join(sorted(unknown))}")
+
+    hnsw_ef = EF_SEARCH if hnsw_ef is None else int(hnsw_ef)
+    if hnsw_ef <= 0:
+        raise ValueError("'hnsw_ef' must be a positive integer")
+
+    return {
+        "query": str(item.get("query") or "").strip(),
+        "filters": {k: filter_value(k, v) for k, v in filters.items() if v is not None},
+        "top_k": max(1, min(top_k, MAX_TOP_K)),
+        "threshold": SIM_THRESHOLD if threshold is None else float(threshold),
+        "hnsw_ef": hnsw_ef
+    }
+
+
+def search_params(spec):
+    # On a quantized collection HNSW runs over the compressed vectors; fetch
+    # `oversampling` times more candidates and rescore them with the originals.
+    quantization = None
+    if QUANTIZATION != "none":
+        quantization = QuantizationSearchParams(
+            ignore = False,
+            rescore = QUANTIZATION_RESCORE,
+            oversampling = QUANTIZATION_OVERSAMPLING
+        )
+
+    return SearchParams(hnsw_ef = spec["hnsw_ef"], quantization = quantization)
+
+
+def query_filter(spec):
+    must, must_not = [], []
+
+    # Hierarchical mode searches only the children of the top-ranked categories,
+    # which also keeps category nodes themselves out of the results.
+    if spec.get("parent_ids") is not None:
+        must.append(FieldCondition(key = "parent_id", match = MatchAny(any = spec["parent_ids"])))
+        must_not.append(FieldCondition(key = "parent_id", match = MatchValue(value = 0)))
+
+    # Tenant filters (domain_id, platform_id, visibility flags) are indexed in the
+    # payload, so Qdrant applies them during the HNSW traversal.
+    for key, value in spec.get("filters", {}).items():
+        if isinstance(value, list):
+            must.append(FieldCondition(key = key, match = MatchAny(any = value)))
+        else:
+            must.append(FieldCondition(key = key, match = MatchValue(value = value)))
+
+    if not must and not must_not:
+        return None
+    return Filter(must = must or None, must_not = must_not or None)
+
+
+def local_mask(spec, local_index):
+    mask = None
+
+    if spec.get("parent_ids") is not None:
+        mask = local_index.payload_mask("parent_id", spec["parent_ids"])
+
+    for key, value in spec.get("filters", {}).items():
+        field_mask = local_index.payload_mask(key, value if isinstance(value, list) else [value])
+        mask = field_mask if mask is None else mask & field_mask
+
+    return mask
+
+
+def build_requests(specs, vectors):
+    return [
+        QueryRequest(
+            query = vector.tolist(),
+            filter = query_filter(spec),
+            with_payload = True,
+            limit = spec["top_k"],
+            params = search_params(spec)
+        )
+        for spec, vector in zip(specs, vectors)
+    ]
+
+
+def confident(points):
+    if not points or points[0].score < CASCADE_MIN_SCORE:
+        return False
+    return len(points) < 2 or points[0].score - points[1].score >= CASCADE_MIN_MARGIN
+
+
+class Matcher:
+    # Troubleshooter matching without the HTTP layer: encode, optional category
+    # stage, vector search (Qdrant or the in-process LocalIndex) and the optional
+    # cascade. app.py wraps one behind /match. Nothing is loaded until start() or
+    # the first match.
+
+    def __init__(self, index_backend = INDEX_BACKEND, retrieval_mode = RETRIEVAL_MODE, cascade = CASCADE,
+                 qdrant_host = QDRANT_HOST, qdrant_port = QDRANT_PORT, wait_for_collection = False,
+                 executor = None, registry = None):
+        self.index_backend = index_backend
+        self.retrieval_mode = retrieval_mode
+        self.qdrant_host = qdrant_host
+        self.qdrant_port = qdrant_port
+        self.wait_for_collection = wait_for_collection
+        self.executor = executor
+        self.client = None
+        self.async_client = None
+        self.ready = False
+        self.phases = {}
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._category_watcher = None
+
+        self.primary = Tier(
+            "primary", MODEL_NAME, COLLECTION, ENCODER_BACKEND, ENCODER_ONNX_FILE, MODEL_PATH, EMBEDDING_DIM, LOCAL_INDEX_SNAPSHOT
+        )
+        self.fast = None
+        if cascade:
+            self.fast = Tier(
+                "fast", CASCADE_MODEL_NAME, CASCADE_COLLECTION, CASCADE_ENCODER_BACKEND, CASCADE_ONNX_FILE, CASCADE_MODEL_PATH,
+                snapshot_path = f"{LOCAL_INDEX_SNAPSHOT}.fast" if LOCAL_INDEX_SNAPSHOT else None
+            )
+        self.tiers = [t for t in (self.fast, self.primary) if t is not None]
+
+        metrics = registry or Registry()
+        self.encode_seconds = metrics.histogram("embedding_encode_seconds", "Time spent in model.encode per batch")
+        self.search_seconds = metrics.histogram("embedding_search_seconds", "Time spent querying the vector index per batch")
+        self.batch_size = metrics.histogram("embedding_batch_size", "Queries per encode/search batch", SIZE_BUCKETS)
+        self.encoded_texts = metrics.histogram("embedding_encoded_texts", "Texts actually encoded per batch after cache lookups", SIZE_BUCKETS)
+        self.answered_by = metrics.counter("embedding_answered_total", "Queries answered by each cascade tier")
+
+    def start(self):
+        with self._start_lock:
+            if self.ready:
+                return self
+
+            phases = [
+                ("load_model", self.load_models),
+                ("connect_qdrant", self.connect),
+                ("load_local_index", self.load_local_indexes),
+                ("build_category_index", self.build_category_indexes),
+                ("warm_up", self.warm_up)
+            ]
+
+            started = time.perf_counter()
+            for phase, step in phases:
+                phase_started = time.perf_counter()
+                step()
+                self.phases[phase] = round(time.perf_counter() - phase_started, 3)
+                print(f"[STARTUP] - {phase} took {self.phases[phase]}s")
+
+            self.phases["total"] = round(time.perf_counter() - started, 3)
+            self.ready = True
+            print(f"[STARTUP] - ready in {self.phases['total']}s")
+
+        return self
+
+    def load_model(self, tier):
+        # A local model directory is loaded without any Hugging Face hub lookups.
+        if tier.model_path:
+            tier.model = load_encoder(tier.model_path, tier.backend, tier.onnx_file, tier.dim, local_files_only = True)
+        else:
+            tier.model = load_encoder(tier.model_name, tier.backend, tier.onnx_file, tier.dim)
+
+        tier.cache.set_model(tier.encoder)
+        return tier.model
+
+    def load_models(self):
+        for tier in self.tiers:
+            self.load_model(tier)
+
+    def check_index_encoder(self, tier):
+        points, _ = self.client.scroll(collection_name = tier.collection, limit = 1, with_payload = ["encoder"])
+        indexed_with = points[0].payload.get("encoder") if points else None
+
+        if indexed_with and indexed_with != tier.encoder:
+            print(f"[WARNING] - {tier.collection} was indexed with {indexed_with} but queries use {tier.encoder}")
+
+    def collection_available(self, name):
+        if any(a.alias_name == name for a in self.client.get_aliases().aliases):
+            return True
+        return self.client.collection_exists(name)
+
+    def connect(self):
+        self.client = QdrantClient(host = self.qdrant_host, port = self.qdrant_port)
+        for tier in self.tiers:
+            while not self.collection_available(tier.collection):
+                if not self.wait_for_collection:
+                    raise RuntimeError(f"Qdrant collection {tier.collection} not found")
+                print(f"[STARTUP] - collection {tier.collection} not found, retrying in {STARTUP_RETRY_SECONDS}s")
+                time.sleep(STARTUP_RETRY_SECONDS)
+
+        self.async_client = AsyncQdrantClient(host = self.qdrant_host, port = self.qdrant_port)
+        for tier in self.tiers:
+            self.check_index_encoder(tier)
+
+    def load_local_indexes(self):
+        if self.index_backend != "local":
+            return
+
+        for tier in self.tiers:
+            tier.local_index = LocalIndex(self.client, tier.collection, snapshot_path = tier.snapshot_path).load()
+            tier.local_index.watch(LOCAL_INDEX_REFRESH_SECONDS)
+
+    def build_category_indexes(self):
+        if self.retrieval_mode != "hierarchical":
+            return
+
+        # The centroids follow the collection: with the local index they are
+        # rebuilt whenever it reloads, against Qdrant whenever the collection's
+        # fingerprint changes (checked every CATEGORY_REFRESH_SECONDS).
+        for tier in self.tiers:
+            if tier.local_index is not None:
+                self.build_category_index(tier)
+                tier.local_index.on_reload = lambda tier = tier: self.build_category_index(tier)
+            else:
+                self.refresh_category_index(tier)
+        self.watch_categories()
+
+    def scroll_children(self, tier):
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name = tier.collection,
+                scroll_filter = Filter(must_not = [FieldCondition(key = "parent_id", match = MatchValue(value = 0))]),
+                limit = 256,
+                offset = offset,
+                with_payload = ["parent_id", "category"],
+                with_vectors = True
+            )
+
+            for p in points:
+                yield p.payload, p.vector
+
+            if offset is None:
+                break
+
+    def build_category_index(self, tier):
+        # Stage one of hierarchical retrieval ranks categories (parent_id = 0) by the
+        # normalized mean of their children's vectors. The centroids are summed while
+        # scrolling, so memory grows with the number of categories only. With the
+        # local index they come from its own vectors, so both describe the same
+        # version of the collection.
+        if tier.local_index is not None:
+            _, payloads, matrix = tier.local_index.contents()
+            points = zip(payloads, matrix)
+        else:
+            points = self.scroll_children(tier)
+
+        sums, counts, names = {}, {}, {}
+        for payload, vector in points:
+            parent_id = payload.get("parent_id")
+            if not parent_id:
+                continue
+            sums[parent_id] = sums.get(parent_id, 0) + np.asarray(vector, dtype = np.float32)
+            counts[parent_id] = counts.get(parent_id, 0) + 1
+            names[parent_id] = payload.get("category")
+
+        index = LocalIndex(None, tier.collection)
+        index.swap(
+            list(sums),
+            [{"parent_id": parent_id, "category": names[parent_id]} for parent_id in sums],
+            [sums[parent_id] / counts[parent_id] for parent_id in sums]
+        )
+        tier.category_index = index
+        print(f"[CATEGORY INDEX] - built {len(index)} category centroids for {tier.collection}")
+
+    def collection_fingerprint(self, tier):
+        # Ids, parents and content hashes only: a point whose text changed gets a
+        # new content_hash, so the vectors themselves need not be fetched.
+        ids, payloads = [], []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name = tier.collection,
+                limit = 256,
+                offset = offset,
+                with_payload = ["parent_id", "category", "content_hash", "encoder"],
+                with_vectors = False
+            )
+
+            for p in points:
+                ids.append(p.id)
+                payloads.append(p.payload or {})
+
+            if offset is None:
+                break
+
+        return LocalIndex.fingerprint_of(ids, payloads, [])
+
+    def refresh_category_index(self, tier):
+        fingerprint = self.collection_fingerprint(tier)
+        if fingerprint == tier.category_fingerprint:
+            return False
+
+        self.build_category_index(tier)
+        tier.category_fingerprint = fingerprint
+        return True
+
+    def watch_categories(self):
+        tiers = [t for t in self.tiers if t.local_index is None]
+        if CATEGORY_REFRESH_SECONDS <= 0 or not tiers or self._category_watcher is not None:
+            return
+
+        def run():
+            while not self._stop.wait(CATEGORY_REFRESH_SECONDS):
+                for tier in tiers:
+                    try:
+                        self.refresh_category_index(tier)
+                    except Exception as e:
+                        print(f"[CATEGORY INDEX ERROR] - {e}")
+
+        self._category_watcher = threading.Thread(target = run, name = "category-watcher", daemon = True)
+        self._category_watcher.start()
+
+    def warm_up(self):
+        # Run the shapes real traffic will use so the first requests don't pay for
+        # lazy allocation: a single query and a full micro-batch.
+        batch = (WARMUP_QUERIES * BATCH_MAX_SIZE)[:BATCH_MAX_SIZE]
+        for tier in self.tiers:
+            tier.model.encode(WARMUP_QUERIES[0], normalize_embeddings = True)
+            vectors = tier.model.encode(batch, normalize_embeddings = True, batch_size = BATCH_MAX_SIZE)
+
+            if tier.local_index is not None:
+                tier.local_index.search(vectors, TOP_K)
+            else:
+                self.client.query_points(collection_name = tier.collection, query = vectors[0].tolist(), limit = TOP_K)
+
+    def reload(self):
+        response = {}
+        for tier in self.tiers:
+            # A local index reload rebuilds the centroids through its on_reload hook.
+            reloaded = False
+            if tier.local_index is not None:
+                reloaded = tier.local_index.reload_if_changed()
+            elif tier.category_index is not None:
+                reloaded = self.refresh_category_index(tier)
+
+            response[tier.name] = {
+                "reloaded": reloaded,
+                "points": len(tier.local_index) if tier.local_index is not None else None,
+                "categories": len(tier.category_index) if tier.category_index is not None else None
+            }
+
+        # The primary tier's figures stay at the top level for existing callers.
+        return dict(response.pop(self.primary.name), **response)
+
+    def cache_stats(self):
+        stats = {}
+        for tier in self.tiers:
+            stats[tier.name] = tier.cache.stats()
+            if tier.store is not None:
+                stats[tier.name]["store"] = tier.store.stats()
+
+        return dict(stats.pop(self.primary.name), **stats)
+
+    def close(self):
+        self._stop.set()
+        for tier in self.tiers:
+            if tier.local_index is not None:
+                tier.local_index.stop()
+        if self.client is not None:
+            self.client.close()
+
+    async def aclose(self):
+        if self.async_client is not None:
+            await self.async_client.close()
+        self.close()
+
+    def encode_with_model(self, tier, texts):
+        self.encoded_texts.observe(len(texts), tier = tier.name)
+        with self.encode_seconds.time(tier = tier.name):
+            return tier.model.encode(
+                texts,
+                normalize_embeddings = True,
+                batch_size = min(len(texts), BATCH_MAX_SIZE)
+            )
+
+    def encode_queries(self, tier, queries):
+        vectors = [tier.cache.get(query) for query in queries]
+
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(normalize_query(queries[i]), []).append(i)
+
+        if missing:
+            texts = [queries[positions[0]] for positions in missing.values()]
+            encode_fn = lambda batch: self.encode_with_model(tier, batch)
+            if tier.store is not None:
+                encoded = tier.store.encode(texts, encode_fn, write = EMBEDDING_STORE_WRITE_QUERIES)
+            else:
+                encoded = encode_fn(texts)
+
+            for text, positions, vector in zip(texts, missing.values(), encoded):
+                tier.cache.put(text, vector)
+                for i in positions:
+                    vectors[i] = vector
+
+        return vectors
+
+    def with_categories(self, specs, categories):
+        return [
+            dict(spec, parent_ids = [hit.id for hit in hits])
+            for spec, hits in zip(specs, categories)
+        ]
+
+    async def search_qdrant_async(self, collection, specs, vectors):
+        requests = build_requests(specs, vectors)
+
+        chunks = await asyncio.gather(*[
+            self.async_client.query_batch_points(
+                collection_name = collection,
+                requests = requests[start:start + QDRANT_BATCH_SIZE]
+            )
+            for start in range(0, len(requests), QDRANT_BATCH_SIZE)
+        ])
+
+        return [response.points for chunk in chunks for response in chunk]
+
+    async def search_tier_async(self, tier, specs):
+        loop = asyncio.get_running_loop()
+        vectors = await loop.run_in_executor(
+            self.executor, self.encode_queries, tier, [spec["query"] for spec in specs]
+        )
+
+        if tier.category_index is not None:
+            with self.search_seconds.time(backend = "categories", tier = tier.name):
+                categories = await loop.run_in_executor(
+                    self.executor, tier.category_index.search, vectors, HIERARCHY_TOP_CATEGORIES
+                )
+            specs = self.with_categories(specs, categories)
+
+        with self.search_seconds.time(backend = self.index_backend, tier = tier.name):
+            if tier.local_index is not None:
+                return await loop.run_in_executor(
+                    self.executor,
+                    tier.local_index.search,
+                    vectors,
+                    [spec["top_k"] for spec in specs],
+                    [local_mask(spec, tier.local_index) for spec in specs]
+                )
+            return await self.search_qdrant_async(tier.collection, specs, vectors)
+
+    def fast_specs(self, specs):
+        # The fast tier always fetches at least two hits so the top-1/top-2 margin
+        # can be measured.
+        return [dict(spec, top_k = max(spec["top_k"], 2)) for spec in specs]
+
+    def split_confident(self, specs, fast_hits):
+        # Queries the fast tier is sure about are answered from it; only the
+        # others are escalated to the primary tier.
+        hits = [None] * len(specs)
+        answered_by = [self.primary.name] * len(specs)
+        if fast_hits is None:
+            return hits, answered_by, list(range(len(specs)))
+
+        escalated = []
+        for i, points in enumerate(fast_hits):
+            if confident(points):
+                hits[i] = points[:specs[i]["top_k"]]
+                answered_by[i] = self.fast.name
+            else:
+                escalated.append(i)
+
+        return hits, answered_by, escalated
+
+    def to_results(self, specs, hits, answered_by):
+        results = []
+        for spec, points, tier in zip(specs, hits, answered_by):
+            self.answered_by.inc(tier = tier)
+            results.append({"matches": to_matches(points, spec["threshold"]), "tier": tier})
+
+        return results
+
+    async def match_specs_async(self, specs):
+        if not self.ready:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.start)
+        self.batch_size.observe(len(specs))
+
+        fast_hits = None
+        if self.fast is not None:
+            fast_hits = await self.search_tier_async(self.fast, self.fast_specs(specs))
+        hits, answered_by, escalated = self.split_confident(specs, fast_hits)
+
+        if escalated:
+            primary_hits = await self.search_tier_async(self.primary, [specs[i] for i in escalated])
+            for i, points in zip(escalated, primary_hits):
+                hits[i] = points
+
+        return self.to_results(specs, hits, answered_by)
@@ -0,0 +1,141 @@
+import bisect, math, threading, time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + pairs + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation):
+        super().__init__(name, documentation)
+        self._values = {}
+
+    def inc(self, amount = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{format_labels(key)} {format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback = None):
+        super().__init__(name, documentation)
+        self.value = 0
+        self.callback = callback
+
+    def inc(self, amount = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount = 1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def render(self):
+        value = self.callback() if self.callback else self.value
+        return self.header() + [f"{self.name} {format_value(value)}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets = LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+
+        lines = self.header()
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = key + (("le", format_value(bound)),)
+                lines.append(f"{self.name}_bucket{format_labels(labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation):
+        return self.register(Counter(name, documentation))
+
+    def gauge(self, name, documentation, callback = None):
+        return self.register(Gauge(name, documentation, callback))
+
+    def histogram(self, name, documentation, buckets = LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
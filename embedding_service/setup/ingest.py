@@ -0,0 +1,123 @@
+import queue, threading, time
+from itertools import islice
+
+
+def windows(items, size):
+    iterator = iter(items)
+    while True:
+        window = list(islice(iterator, size))
+        if not window:
+            return
+        yield window
+
+
+class IngestionPipeline:
+    # Streams items through encode -> upsert without ever holding the whole
+    # catalog. Items are read in windows of `window_size`, sorted by text length
+    # inside the window so each encode batch pads to a similar length, and the
+    # resulting points are handed to an uploader thread through a bounded queue.
+    # When Qdrant falls behind the queue fills up and encoding waits, so memory
+    # stays at roughly window_size items plus max_pending_chunks upsert chunks.
+
+    def __init__(self, client, collection, model_loader, batch_size = 64, window_size = 2048,
+                 upsert_chunk = 256, max_pending_chunks = 4, workers = 0, progress_every = 5.0, store = None):
+        self.client = client
+        self.collection = collection
+        self.model_loader = model_loader
+        self.batch_size = batch_size
+        self.window_size = max(window_size, batch_size)
+        self.upsert_chunk = upsert_chunk
+        self.max_pending_chunks = max_pending_chunks
+        self.workers = workers
+        self.progress_every = progress_every
+        self.store = store
+        self.model = None
+        self.pool = None
+        self.stats = {"encoded": 0, "upserted": 0, "seconds": 0.0, "docs_per_sec": 0.0}
+
+    def encode(self, texts):
+        # With an embedding store only texts it has never seen reach the model,
+        # and the model itself is not loaded until the first such text shows up.
+        if self.store is not None:
+            return self.store.encode(texts, self.encode_with_model)
+        return self.encode_with_model(texts)
+
+    def encode_with_model(self, texts):
+        if self.model is None:
+            self.model = self.model_loader()
+            if self.workers > 1:
+                self.pool = self.model.start_multi_process_pool(["cpu"] * self.workers)
+
+        return self.model.encode(
+            texts,
+            normalize_embeddings = True,
+            batch_size = self.batch_size,
+            pool = self.pool
+        )
+
+    def upload(self, chunks, errors):
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                return
+
+            try:
+                if not errors:
+                    self.client.upsert(collection_name = self.collection, points = chunk, wait = True)
+                    self.stats["upserted"] += len(chunk)
+            except Exception as e:
+                errors.append(e)
+
+    def report(self, started, final = False):
+        elapsed = time.perf_counter() - started
+        self.stats["seconds"] = round(elapsed, 3)
+        self.stats["docs_per_sec"] = round(self.stats["encoded"] / elapsed, 2) if elapsed else 0.0
+        label = "done" if final else "progress"
+        print(f"[INGEST] - {label}: {self.stats['encoded']} encoded, {self.stats['upserted']} upserted, {self.stats['docs_per_sec']} docs/sec")
+
+    def run(self, items, text_fn, point_fn):
+        chunks = queue.Queue(maxsize = self.max_pending_chunks)
+        errors = []
+        uploader = threading.Thread(target = self.upload, args = (chunks, errors), name = "ingest-upload", daemon = True)
+        uploader.start()
+
+        started = last_report = time.perf_counter()
+        pending = []
+
+        try:
+            for window in windows(items, self.window_size):
+                if errors:
+                    break
+
+                window.sort(key = lambda item: len(text_fn(item)))
+
+                for start in range(0, len(window), self.batch_size):
+                    batch = window[start:start + self.batch_size]
+                    vectors = self.encode([text_fn(item) for item in batch])
+                    self.stats["encoded"] += len(batch)
+
+                    pending.extend(point_fn(item, vector) for item, vector in zip(batch, vectors))
+                    while len(pending) >= self.upsert_chunk:
+                        chunks.put(pending[:self.upsert_chunk])
+                        pending = pending[self.upsert_chunk:]
+
+                if time.perf_counter() - last_report >= self.progress_every:
+                    self.report(started)
+                    last_report = time.perf_counter()
+
+            if pending and not errors:
+                chunks.put(pending)
+        finally:
+            chunks.put(None)
+            uploader.join()
+            if self.store is not None:
+                self.stats["store"] = self.store.stats()
+            if self.pool is not None:
+                self.model.stop_multi_process_pool(self.pool)
+                self.pool = None
+
+        if errors:
+            raise errors[0]
+
+        self.report(started, final = True)
+        return self.stats
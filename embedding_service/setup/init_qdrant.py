@@ -1,86 +1,326 @@
-import os, json, requests
+import os, sys, time, hashlib, argparse
 from dotenv import load_dotenv
 from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, HnswConfigDiff, PointStruct
-from sentence_transformers import SentenceTransformer
+from qdrant_client.models import (
+    VectorParams, Distance, HnswConfigDiff, PointStruct, PointIdsList,
+    CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    ProductQuantization, ProductQuantizationConfig, CompressionRatio, PayloadSchemaType
+)
 
-load_dotenv()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_store import EmbeddingStore
+from encoders import embedding_space, encoder_id, load_encoder
+from ingest import IngestionPipeline
+from sources import open_source
 
-def get_action_list(sync_type):
-    url = "https://dev.workelevate.com/api/Chatbot/SyncActionData"
+load_dotenv()
 
-    payload = {
-        'machine_name': '',
-        'domain_name': 'progressive.in',
-        'user_name': 'harsh.vardhan',
-        'sync_type': f'{sync_type}',
-        'domain_id': 2,
-        'platform_id': 1
-    }
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2")
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch").lower()
+ENCODER_ONNX_FILE = os.getenv("ENCODER_ONNX_FILE")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 0)) or None
+ENCODER_ID = encoder_id(MODEL_NAME, ENCODER_BACKEND, ENCODER_ONNX_FILE, EMBEDDING_DIM)
 
-    headers = {
-        "accept": "*/*",
-        "Authorization": f"Bearer {os.getenv('JOB_SCHEDULER_SYNC_DATA_BEARER_TOKEN')}",
-        "Content-Type": "application/json-patch+json"
-    }
+COLLECTION = os.getenv("QDRANT_COLLECTION")
+# 768 for all-mpnet-base-v2; set EMBEDDING_SIZE=384 when indexing the MiniLM
+# collection used by the cascade fast tier.
+VECTOR_SIZE = EMBEDDING_DIM or int(os.getenv("EMBEDDING_SIZE", 768))
+ENCODE_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+ENCODE_WINDOW_SIZE = int(os.getenv("INGEST_WINDOW_SIZE", 2048))
+ENCODE_WORKERS = int(os.getenv("INGEST_WORKERS", 0))
+UPSERT_CHUNK_SIZE = int(os.getenv("INGEST_UPSERT_CHUNK", 256))
+MAX_PENDING_CHUNKS = int(os.getenv("INGEST_MAX_PENDING_CHUNKS", 4))
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR")
+HNSW_M = int(os.getenv("HNSW_M", 16))
+HNSW_EF_CONSTRUCT = int(os.getenv("HNSW_EF_CONSTRUCT", 100))
+HNSW_FULL_SCAN_THRESHOLD = int(os.getenv("HNSW_FULL_SCAN_THRESHOLD", 1000))
+KEEP_VERSIONS = int(os.getenv("QDRANT_KEEP_VERSIONS", 1))
+WARMUP_SAMPLE_SIZE = int(os.getenv("REBUILD_WARMUP_QUERIES", 50))
+TROUBLESHOOTER_SOURCE = os.getenv("TROUBLESHOOTER_SOURCE", "api")
+QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()
+PQ_COMPRESSION = os.getenv("QDRANT_PQ_COMPRESSION", "x16")
+VECTORS_ON_DISK = os.getenv("QDRANT_VECTORS_ON_DISK", "false").lower() == "true"
 
-    response = requests.post(
-        url,
-        data=json.dumps(payload),
-        headers=headers,
-        timeout=10
-    )
+def troubleshooter_text(t):
+    return f"{t.get('name', '')} {t.get('description', '')}".strip()
 
-    response.raise_for_status()
+def content_hash(t):
+    return hashlib.sha256(troubleshooter_text(t).encode("utf-8")).hexdigest()
 
-    try:
-        return response.json()
-    except Exception:
-        return response.text
+def is_indexable(t):
+    return t.get("is_active", True) is not False and not t.get("is_deleted", False)
 
-client = QdrantClient(host=os.getenv("QDRANT_HOST"), port=os.getenv("QDRANT_PORT"))
-model = SentenceTransformer("all-mpnet-base-v2")
+# Bump when build_payload gains fields so existing points get their payload
+# rewritten on the next sync without re-encoding.
+PAYLOAD_VERSION = 2
 
-COLLECTION = os.getenv("QDRANT_COLLECTION")
-VECTOR_SIZE = 768
+def build_payload(t):
+    return {
+        "troubleshooter_id" : t['troubleshooter_id'],
+        "name" : t.get("name", ""),
+        "ps_command_id" : t['ps_command_id'],
+        "parent_id" : t.get("parent_id") or 0,
+        "category" : t.get("category"),
+        "domain_id" : t.get("domain_id"),
+        "platform_id" : t.get("platform_id"),
+        "is_active" : t.get("is_active", True) is not False,
+        "user_view" : bool(t.get("user_view")),
+        "admin_view" : bool(t.get("admin_view")),
+        "payload_version" : PAYLOAD_VERSION,
+        "content_hash" : content_hash(t),
+        "updated_on" : t.get("updated_on"),
+        "encoder" : ENCODER_ID
+    }
 
-troubleshooters = get_action_list(sync_type=3)
+def quantization_config(kind = QUANTIZATION, pq_compression = PQ_COMPRESSION):
+    # Quantized vectors stay in RAM for the HNSW search; the original float32
+    # vectors are only read to rescore the oversampled candidates, so they can
+    # live in memory-mapped files on disk (QDRANT_VECTORS_ON_DISK).
+    if kind == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if kind == "product":
+        return ProductQuantization(
+            product=ProductQuantizationConfig(compression=CompressionRatio(pq_compression), always_ram=True)
+        )
+    if kind in ("", "none"):
+        return None
+    raise ValueError(f"Unknown QDRANT_QUANTIZATION '{kind}', expected none, scalar or product")
 
-if not client.collection_exists(COLLECTION):
+def create_collection(client, name, size = VECTOR_SIZE, quantization = QUANTIZATION, on_disk = VECTORS_ON_DISK, pq_compression = PQ_COMPRESSION):
     client.create_collection(
-        collection_name=COLLECTION,
+        collection_name=name,
         vectors_config=VectorParams(
-            size=VECTOR_SIZE,
-            distance=Distance.COSINE
+            size=size,
+            distance=Distance.COSINE,
+            on_disk=on_disk
         ),
         hnsw_config=HnswConfigDiff(
-            m=16,
-            ef_construct=100,
-            full_scan_threshold=1000
-        )
+            m=HNSW_M,
+            ef_construct=HNSW_EF_CONSTRUCT,
+            full_scan_threshold=HNSW_FULL_SCAN_THRESHOLD
+        ),
+        quantization_config=quantization_config(quantization, pq_compression)
     )
+    ensure_payload_indexes(client, name)
+
+PAYLOAD_INDEXES = {
+    "parent_id": PayloadSchemaType.INTEGER,
+    "domain_id": PayloadSchemaType.INTEGER,
+    "platform_id": PayloadSchemaType.INTEGER,
+    "is_active": PayloadSchemaType.BOOL,
+    "user_view": PayloadSchemaType.BOOL,
+    "admin_view": PayloadSchemaType.BOOL
+}
 
-points = []
+def ensure_payload_indexes(client, name):
+    # Indexed payload fields let Qdrant apply filters inside the HNSW traversal
+    # instead of scanning candidates afterwards.
+    for field, schema in PAYLOAD_INDEXES.items():
+        client.create_payload_index(collection_name=name, field_name=field, field_schema=schema)
 
-for idx, t in enumerate(troubleshooters):
-    name = t.get("name", "")
-    description = t.get("description", "")
-    text = f"{name} {description}".strip()
+def alias_target(client, alias):
+    for a in client.get_aliases().aliases:
+        if a.alias_name == alias:
+            return a.collection_name
+    return None
 
-    vector = model.encode(text, normalize_embeddings=True)
+def check_encoder(encoders, target):
+    # Running replicas keep encoding queries with the model they started with, so
+    # a collection (or the alias they query) must never switch to another model's
+    # vectors underneath them. A new model is indexed under its own
+    # QDRANT_COLLECTION alias and the service is moved to it instead.
+    changed = sorted(e for e in encoders if e and embedding_space(e) != embedding_space(ENCODER_ID))
+    if changed:
+        raise RuntimeError(
+            f"{target} is indexed with {', '.join(changed)} but this run encodes with {ENCODER_ID}; "
+            "index the new model under its own QDRANT_COLLECTION and point the service at it"
+        )
+
+def live_encoders(client, alias):
+    live = alias_target(client, alias) or (alias if client.collection_exists(alias) else None)
+    if live is None:
+        return set()
+
+    points, _ = client.scroll(collection_name = live, limit = 1, with_payload = ["encoder"])
+    return {p.payload.get("encoder") for p in points if p.payload}
+
+def ensure_collection(client, name = COLLECTION):
+    if alias_target(client, name) is None and not client.collection_exists(name):
+        create_collection(client, name)
+    else:
+        ensure_payload_indexes(client, name)
 
-    points.append(
-        PointStruct(
-            id = idx,
-            vector = vector.tolist(),
-            payload = {
-                "troubleshooter_id" : t['troubleshooter_id'],
-                "name" : name,
-                "ps_command_id" : t['ps_command_id']
-            }
+def indexed_state(client, collection = COLLECTION):
+    state = {}
+    offset = None
+
+    while True:
+        points, offset = client.scroll(
+            collection_name = collection,
+            limit = 256,
+            offset = offset,
+            with_payload = ["content_hash", "updated_on", "encoder", "payload_version"],
+            with_vectors = False
         )
+
+        for p in points:
+            state[p.id] = p.payload or {}
+
+        if offset is None:
+            break
+
+    return state
+
+def plan_sync(troubleshooters, indexed, to_update_payload, wanted):
+    # Points are keyed by troubleshooter_id. Only items whose name/description
+    # hash (or encoder) changed are yielded for re-encoding; items whose other
+    # fields changed are collected for a payload-only update, and every id that
+    # should stay in the collection is recorded in `wanted`.
+    for t in troubleshooters:
+        if not is_indexable(t):
+            continue
+
+        point_id = int(t['troubleshooter_id'])
+        wanted.add(point_id)
+        payload = build_payload(t)
+        current = indexed.get(point_id)
+
+        if current is None or current.get("content_hash") != payload["content_hash"] or current.get("encoder") != ENCODER_ID:
+            yield t
+        elif current.get("updated_on") != payload["updated_on"] or current.get("payload_version") != PAYLOAD_VERSION:
+            to_update_payload.append(t)
+
+def load_model():
+    return load_encoder(MODEL_NAME, ENCODER_BACKEND, ENCODER_ONNX_FILE, EMBEDDING_DIM)
+
+def to_point(t, vector):
+    return PointStruct(
+        id = int(t['troubleshooter_id']),
+        vector = vector.tolist(),
+        payload = build_payload(t)
     )
 
-client.upsert(collection_name = COLLECTION, points = points)
+def sync(client, troubleshooters, model_loader = load_model, collection = COLLECTION):
+    ensure_collection(client, collection)
+    indexed = indexed_state(client, collection)
+    check_encoder({p.get("encoder") for p in indexed.values()}, collection)
+    to_update_payload, wanted = [], set()
+
+    # The encoder is only loaded once the first changed item that is not
+    # already in the embedding store reaches it.
+    pipeline = IngestionPipeline(
+        client,
+        collection,
+        model_loader,
+        batch_size = ENCODE_BATCH_SIZE,
+        window_size = ENCODE_WINDOW_SIZE,
+        upsert_chunk = UPSERT_CHUNK_SIZE,
+        max_pending_chunks = MAX_PENDING_CHUNKS,
+        workers = ENCODE_WORKERS,
+        store = EmbeddingStore(EMBEDDING_STORE_DIR, ENCODER_ID) if EMBEDDING_STORE_DIR else None
+    )
+    stats = pipeline.run(plan_sync(troubleshooters, indexed, to_update_payload, wanted), troubleshooter_text, to_point)
+
+    for t in to_update_payload:
+        client.overwrite_payload(
+            collection_name = collection,
+            payload = build_payload(t),
+            points = [int(t['troubleshooter_id'])]
+        )
+
+    to_delete = [point_id for point_id in indexed if point_id not in wanted]
+    if to_delete:
+        client.delete(collection_name = collection, points_selector = PointIdsList(points = to_delete))
+
+    return {
+        "encoded": stats["encoded"],
+        "payload_updated": len(to_update_payload),
+        "deleted": len(to_delete),
+        "docs_per_sec": stats["docs_per_sec"]
+    }
+
+def versioned_collections(client, alias = COLLECTION):
+    prefix = f"{alias}_v"
+    return sorted(
+        c.name for c in client.get_collections().collections
+        if c.name.startswith(prefix) and c.name[len(prefix):].isdigit()
+    )
+
+def warm_collection(client, collection):
+    # Touch the HNSW graph and payload storage with the collection's own vectors
+    # as sample queries before any user traffic is switched over, so the first
+    # live queries aren't cold. No encoding is needed for this.
+    points, _ = client.scroll(
+        collection_name = collection,
+        limit = WARMUP_SAMPLE_SIZE,
+        with_payload = False,
+        with_vectors = True
+    )
+
+    for p in points:
+        client.query_points(collection_name = collection, query = p.vector, limit = 3, with_payload = True)
+
+def switch_alias(client, alias, collection):
+    if alias_target(client, alias) is None and client.collection_exists(alias):
+        # One-time migration from a plain collection to an alias. Qdrant can't
+        # give an alias the name of an existing collection, so the old one has to
+        # be dropped first and queries fail until the alias is created below.
+        print(f"[REBUILD] - dropping legacy collection {alias} to replace it with an alias")
+        client.delete_collection(alias)
+
+    client.update_collection_aliases(change_aliases_operations = [
+        DeleteAliasOperation(delete_alias = DeleteAlias(alias_name = alias)),
+        CreateAliasOperation(create_alias = CreateAlias(collection_name = collection, alias_name = alias))
+    ])
+
+def collect_garbage(client, alias, keep = KEEP_VERSIONS):
+    live = alias_target(client, alias)
+    old = [name for name in versioned_collections(client, alias) if name != live]
+
+    # Keep the most recent `keep` previous versions around for a quick rollback.
+    for name in old[:max(0, len(old) - keep)]:
+        client.delete_collection(name)
+        print(f"[REBUILD] - deleted old collection {name}")
+
+def rebuild(client, troubleshooters, model_loader = load_model, alias = COLLECTION):
+    check_encoder(live_encoders(client, alias), alias)
+
+    collection = f"{alias}_v{time.strftime('%Y%m%d%H%M%S')}"
+    create_collection(client, collection)
+
+    summary = sync(client, troubleshooters, model_loader, collection = collection)
+    warm_collection(client, collection)
+    switch_alias(client, alias, collection)
+    collect_garbage(client, alias)
+
+    summary["collection"] = collection
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description = "Index WorkElevate troubleshooters into Qdrant")
+    parser.add_argument(
+        "--rebuild",
+        action = "store_true",
+        help = "build a new versioned collection and atomically switch the alias to it"
+    )
+    parser.add_argument(
+        "--source",
+        default = TROUBLESHOOTER_SOURCE,
+        help = "'api' for the live SyncActionData endpoint, or a local .json/.jsonl dump such as troubleshooters.json"
+    )
+    args = parser.parse_args()
+
+    client = QdrantClient(host=os.getenv("QDRANT_HOST"), port=os.getenv("QDRANT_PORT"))
+    troubleshooters = open_source(args.source)
+
+    if args.rebuild:
+        summary = rebuild(client, troubleshooters)
+    else:
+        summary = sync(client, troubleshooters)
+    print(f"Qdrant Initialized - {summary}")
 
-print("Qdrant Initialized")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import os, json, requests
+
+SEPARATORS = " \t\r\n,"
+
+
+def get_action_list(sync_type):
+    url = "https://dev.workelevate.com/api/Chatbot/SyncActionData"
+
+    payload = {
+        'machine_name': '',
+        'domain_name': 'progressive.in',
+        'user_name': 'harsh.vardhan',
+        'sync_type': f'{sync_type}',
+        'domain_id': 2,
+        'platform_id': 1
+    }
+
+    headers = {
+        "accept": "*/*",
+        "Authorization": f"Bearer {os.getenv('JOB_SCHEDULER_SYNC_DATA_BEARER_TOKEN')}",
+        "Content-Type": "application/json-patch+json"
+    }
+
+    response = requests.post(
+        url,
+        data=json.dumps(payload),
+        headers=headers,
+        timeout=10
+    )
+
+    response.raise_for_status()
+
+    try:
+        return response.json()
+    except Exception:
+        return response.text
+
+
+def iter_json_array(f, chunk_size = 1 << 16):
+    # Yields the elements of a top-level JSON array one at a time, keeping only
+    # the element being parsed (plus one read chunk) in memory.
+    decoder = json.JSONDecoder()
+    buffer, started, eof = "", False, False
+
+    while True:
+        stripped = buffer.lstrip(SEPARATORS if started else SEPARATORS[:-1])
+        buffer = stripped
+
+        if buffer:
+            if not started:
+                if buffer[0] != "[":
+                    raise ValueError("Expected a JSON array")
+                buffer, started = buffer[1:], True
+                continue
+
+            if buffer[0] == "]":
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A scalar that ends exactly at the end of the buffer may continue
+                # in the next chunk ("12" + "345"), so an element is only complete
+                # once the following ',' or ']' (or EOF) has been read.
+                following = buffer[end:].lstrip(SEPARATORS[:-1])[:1]
+                if following in (",", "]") or (eof and not following):
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+                if eof:
+                    raise ValueError(f"Expected ',' or ']' after array element, got {following!r}")
+
+        elif eof:
+            if started:
+                raise ValueError("Unterminated JSON array")
+            return
+
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_jsonl(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def api_source(sync_type = 3):
+    yield from get_action_list(sync_type = sync_type)
+
+
+def file_source(path):
+    with open(path, encoding = "utf-8") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            yield from iter_jsonl(f)
+        else:
+            yield from iter_json_array(f)
+
+
+def with_hierarchy(items):
+    # Applies the parent_id tree in a single pass: a troubleshooter whose category
+    # is inactive or deleted is treated as inactive itself, and every item is
+    # tagged with its category name. Categories (parent_id = 0) normally precede
+    # their children; a child seen before its category is held back until the
+    # category shows up or the stream ends.
+    categories = {}
+    waiting = {}
+
+    def resolve(t, category):
+        t = dict(t)
+        if category is not None:
+            t["category"] = category.get("name")
+            if category.get("is_active") is False or category.get("is_deleted"):
+                t["is_active"] = False
+        return t
+
+    for t in items:
+        parent_id = t.get("parent_id") or 0
+
+        if parent_id == 0:
+            categories[t.get("troubleshooter_id")] = {
+                "name": t.get("name"),
+                "is_active": t.get("is_active"),
+                "is_deleted": t.get("is_deleted")
+            }
+            yield t
+            for child in waiting.pop(t.get("troubleshooter_id"), []):
+                yield resolve(child, categories[t.get("troubleshooter_id")])
+        elif parent_id in categories:
+            yield resolve(t, categories[parent_id])
+        else:
+            waiting.setdefault(parent_id, []).append(t)
+
+    for children in waiting.values():
+        for child in children:
+            yield resolve(child, None)
+
+
+def open_source(source):
+    # "api" reads the live WorkElevate SyncActionData endpoint; anything else is
+    # treated as a local .json (array) or .jsonl dump.
+    if not source or source == "api":
+        return with_hierarchy(api_source())
+    return with_hierarchy(file_source(source))
@@ -0,0 +1,68 @@
+import os, sys, threading, time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_store import EmbeddingStore, text_hash
+
+
+class SlowLock:
+    # Widens the gap between deciding to take the lock and holding it, the
+    # window in which a concurrent refresh used to re-read the same keys.
+
+    def __init__(self, delay = 0.05):
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        time.sleep(self.delay)
+        self._lock.acquire()
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+def vectors_for(texts, dim = 4):
+    return np.array([[len(t) + i for i in range(dim)] for t in texts], dtype = np.float32)
+
+
+def run_threads(target, count):
+    threads = [threading.Thread(target = target, args = (n,)) for n in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_concurrent_refresh_counts_new_keys_once(tmp_path):
+    reader = EmbeddingStore(str(tmp_path), "model:torch")
+    reader._lock = SlowLock()
+
+    texts = ["printer", "vpn", "outlook"]
+    EmbeddingStore(str(tmp_path), "model:torch").put_many([text_hash(t) for t in texts], vectors_for(texts))
+
+    run_threads(lambda n: reader.refresh(force = True), 4)
+
+    assert len(reader) == 3
+    assert np.array_equal(np.stack(reader.get_many([text_hash(t) for t in texts])), vectors_for(texts))
+
+
+def test_threaded_writers_keep_keys_and_vectors_aligned(tmp_path):
+    stores = [EmbeddingStore(str(tmp_path), "model:torch", refresh_seconds = 0) for _ in range(2)]
+    for store in stores:
+        store._lock = SlowLock(0.001)
+
+    def write(n):
+        store = stores[n % 2]
+        for i in range(20):
+            texts = [f"query {n} {i}", f"shared {i}"]
+            store.put_many([text_hash(t) for t in texts], vectors_for(texts))
+            store.get_many([text_hash(t) for t in texts])
+
+    run_threads(write, 4)
+
+    texts = [f"query {n} {i}" for n in range(4) for i in range(20)] + [f"shared {i}" for i in range(20)]
+    for store in stores:
+        store.refresh(force = True)
+        assert len(store) == len(texts)
+        assert os.path.getsize(store.vectors_path) == len(texts) * store.dim * 4
+        assert np.array_equal(np.stack(store.get_many([text_hash(t) for t in texts])), vectors_for(texts))
@@ -1,11 +1,16 @@
-import json, os
+import asyncio, json, os, threading
+from functools import partial
+import aiohttp
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from rapidfuzz import process, fuzz
 from rasa_sdk import Action, FormValidationAction
 from rasa_sdk.events import SlotSet, FollowupAction, ActiveLoop, AllSlotsReset, ReminderScheduled
-import re, requests
-from requests.auth import HTTPBasicAuth
+import re
+from .embedded_matcher import EmbeddedMatcher
+from .http_client import Upstream
+from .lookup_cache import LookupCache
+from .servicenow import ServiceNowTables
 
 # Fetch by id or email, ticket creation, user detail fetch, incident-service req, have to do only incident
 # after hr/workelevate api answer, ask if it's alright or do we need to raise a ticket
@@ -28,19 +33,110 @@ headers = {
     "Content-Type": "application/json"
 }
 
-def create_incident_ticket(user_email, short_description, ticket_description, category):
-    url = f"https://{instance}.service-now.com/api/now/table/incident"
+# "http" asks the embedding service at MATCH_SERVICE_URL. "embedded" matches in
+# this process (see embedded_matcher.py) against the local index snapshot the
+# service writes to LOCAL_INDEX_SNAPSHOT, encoding with an ONNX export of the
+# service's model (EMBEDDED_ONNX_MODEL, EMBEDDED_TOKENIZER). It only needs the
+# onnxruntime and tokenizers pins in requirements.txt, not the service's own
+# stack. EMBEDDING_MODEL must name the model the snapshot was indexed with. The
+# model and snapshot are loaded in the background while the server starts; a
+# match that takes longer than EMBEDDED_MATCH_TIMEOUT seconds after that fails
+# like a timed out HTTP call.
+TROUBLESHOOTER_MATCHER = os.getenv("TROUBLESHOOTER_MATCHER", "http").lower()
+MATCH_SERVICE_URL = os.getenv("MATCH_SERVICE_URL", "http://localhost:8000/match")
+EMBEDDED_MATCH_TIMEOUT = float(os.getenv("EMBEDDED_MATCH_TIMEOUT", 3))
+troubleshooter_matcher = None
+if TROUBLESHOOTER_MATCHER == "embedded":
+    troubleshooter_matcher = EmbeddedMatcher(
+        os.getenv("LOCAL_INDEX_SNAPSHOT"),
+        os.getenv("EMBEDDED_ONNX_MODEL"),
+        os.getenv("EMBEDDED_TOKENIZER"),
+        os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2"),
+        max_length=int(os.getenv("EMBEDDED_MAX_LENGTH", 384)),
+        threshold=float(os.getenv("EMBEDDED_MATCH_THRESHOLD", 0.25)),
+        top_k=int(os.getenv("EMBEDDED_MATCH_TOP_K", 3))
+    )
+
+# One pooled client per upstream; see http_client.py.
+servicenow = Upstream(
+    "servicenow",
+    f"https://{instance}.service-now.com",
+    headers=headers,
+    auth=aiohttp.BasicAuth(username or "", password or "")
+)
+dify = Upstream(
+    "dify",
+    os.getenv("API_URL"),
+    headers={
+        "Authorization": f"Bearer {os.getenv('BEARER_TOKEN')}",
+        "Content-Type": "application/json"
+    },
+    read_timeout=float(os.getenv("DIFY_READ_TIMEOUT", 60))
+)
+workelevate = Upstream(
+    "workelevate",
+    "https://dev.workelevate.com/api/Chatbot",
+    headers={
+        "Authorization": f"Bearer {os.getenv('JOB_SCHEDULER_SYNC_DATA_BEARER_TOKEN')}",
+        "Content-Type": "application/json-patch+json"
+    },
+    read_timeout=10
+)
+embedding_service = Upstream("embedding", MATCH_SERVICE_URL, connect_timeout=0.5, read_timeout=3)
+tables = ServiceNowTables(servicenow)
+
+INCIDENT_FIELDS = ["sys_id", "number", "short_description", "description", "incident_state"]
+
+# ServiceNow user sys_ids by lower-cased email. Unknown emails are remembered for
+# a shorter time so a newly provisioned user is picked up soon.
+user_sys_ids = LookupCache(
+    ttl=float(os.getenv("USER_SYS_ID_CACHE_TTL", 3600)),
+    negative_ttl=float(os.getenv("USER_SYS_ID_CACHE_NEGATIVE_TTL", 300)),
+    max_size=int(os.getenv("USER_SYS_ID_CACHE_SIZE", 10000))
+)
+
+async def run_blocking(func, *args, **kwargs):
+    # Encoding, model loading and fuzzy matching are CPU bound; running them on
+    # the default executor keeps the event loop free for other conversations.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+async def lookup_user_sys_id(user_email):
+    result = await tables.query("sys_user", query=f"email={user_email}", fields=["sys_id"], limit=1)
+    return result[0]["sys_id"] if result else None
+
+async def get_user_sys_id(user_email):
+    # None for an unknown user; raises if ServiceNow could not be asked.
+    if not user_email:
+        return None
+    return await user_sys_ids.get(user_email.strip().lower(), lookup_user_sys_id)
+
+def start_troubleshooter_matcher():
+    try:
+        troubleshooter_matcher.start()
+    except Exception as e:
+        print(f"[EMBEDDED MATCHER ERROR] - {e}")
 
-    url_sys_id = f"https://{instance}.service-now.com/api/now/table/sys_user?sysparm_query=email={user_email}"
-    response_sys_id = requests.get(url_sys_id, auth=HTTPBasicAuth(username, password), headers=headers)
-    sys_id = None
+if troubleshooter_matcher is not None:
+    threading.Thread(target=start_troubleshooter_matcher, name="embedded-matcher-start", daemon=True).start()
 
-    if response_sys_id.status_code == 200:
-        data = response_sys_id.json()
-        if "result" in data and len(data["result"]) > 0:
-            sys_id = data["result"][0]["sys_id"]
-        else:
-            return {"error": f"No user found with Email Id {user_email}"}
+async def match_embedded(user_query):
+    # Waits for the startup load without a deadline (it is a no-op once done), so
+    # only the match itself is held to EMBEDDED_MATCH_TIMEOUT.
+    await run_blocking(troubleshooter_matcher.start)
+    try:
+        return await asyncio.wait_for(run_blocking(troubleshooter_matcher.match, user_query), EMBEDDED_MATCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"troubleshooter search took longer than {EMBEDDED_MATCH_TIMEOUT}s")
+
+async def create_incident_ticket(user_email, short_description, ticket_description, category):
+    try:
+        sys_id = await get_user_sys_id(user_email)
+    except Exception:
+        return {"error": "Error fetching user data"}
+
+    if not sys_id:
+        return {"error": f"No user found with Email Id {user_email}"}
 
     data = {
         "caller_id" : sys_id,
@@ -49,8 +145,8 @@ def create_incident_ticket(user_email, short_description, ticket_description, ca
         "category": category
     }
 
-    response = requests.post(url, auth = HTTPBasicAuth(username,password), headers=headers, json=data)
-    
+    response = await tables.create("incident", data, fields=["sys_id", "number"])
+
     if response.status_code == 201:
         ticket_data = response.json()['result']
         return ticket_data
@@ -61,13 +157,13 @@ class ActionCreateTicket(Action):
     def name(self):
         return "action_create_ticket"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         user_email = tracker.get_slot("user_email")
         short_description = tracker.get_slot("short_description")
         ticket_description = tracker.get_slot("ticket_description")
         category = tracker.get_slot("category")
 
-        result = create_incident_ticket(user_email, short_description, ticket_description, category)
+        result = await create_incident_ticket(user_email, short_description, ticket_description, category)
 
         if "error" in result:
             dispatcher.utter_message(f"Failed to create the ticket : {result['error']}")
@@ -79,33 +175,31 @@ class ActionCreateTicket(Action):
         dispatcher.utter_message("Let me know if you need anything else.")
         return [SlotSet("short_description", None), SlotSet("ticket_description", None), SlotSet("category", None)]
 
-def fetch_ticket_by_id(ticket_id):  
+async def fetch_ticket_by_id(ticket_id):  
     incident_state_mapping = {
             "1": "New",
             "2": "In Progress",
             "3": "On Hold",
             "4": "Closed"
         }
-    
-    url = f"https://{instance}.service-now.com/api/now/table/incident?sysparm_query=number={ticket_id}"
-    response = requests.get(url, auth = HTTPBasicAuth(username,password), headers=headers)
 
-    if response.status_code == 200:
-        data = response.json()
-        if not data.get("result"):
-            return {"error": f"No ticket found with ID - {ticket_id}"}
-        
-        latest_incident = data["result"][0]
-        incident_number = latest_incident["number"]
-        incident_description = latest_incident.get("description", "No description available")
-        incident_short_description = latest_incident.get("short_description", "No short description available")
-        incident_state_number = latest_incident.get("incident_state", "Unknown")
-        incident_status = incident_state_mapping.get(incident_state_number, "Unknown")
-        return {"ticket_id": incident_number, "short_description": incident_short_description, "description": incident_description, "status": incident_status}
-    else:
+    try:
+        result = await tables.query("incident", query=f"number={ticket_id}", fields=INCIDENT_FIELDS, limit=1)
+    except Exception:
         return {"error": f"Error fetching the ticket with Id {ticket_id}"}
 
-def fetch_ticket_by_email(user_email):
+    if not result:
+        return {"error": f"No ticket found with ID - {ticket_id}"}
+
+    latest_incident = result[0]
+    incident_number = latest_incident["number"]
+    incident_description = latest_incident.get("description", "No description available")
+    incident_short_description = latest_incident.get("short_description", "No short description available")
+    incident_state_number = latest_incident.get("incident_state", "Unknown")
+    incident_status = incident_state_mapping.get(incident_state_number, "Unknown")
+    return {"ticket_id": incident_number, "short_description": incident_short_description, "description": incident_description, "status": incident_status}
+
+async def fetch_ticket_by_email(user_email):
     incident_state_mapping = {
         "1": "New",
         "2": "In Progress",
@@ -114,45 +208,34 @@ def fetch_ticket_by_email(user_email):
         "7": "Closed"
     }
 
-    url = f"https://{instance}.service-now.com/api/now/table/sys_user?sysparm_query=email={user_email}"
-    response = requests.get(url, auth=HTTPBasicAuth(username,password), headers=headers)
-    
-    if response.status_code == 200:
-        data = response.json()
-        if "result" in data:
-            sys_id = data["result"][0]["sys_id"]
-            incidents_url = (
-                f"https://{instance}.service-now.com/api/now/table/incident"
-                f"?sysparm_query=caller_id={sys_id}^ORDERBYDESCsys_updated_on"
-                f"&sysparm_limit=1"
-            )
-            incidents_response = requests.get(incidents_url, auth=HTTPBasicAuth(username,password), headers=headers)
-
-            if incidents_response.status_code == 200:
-                incidents_data = incidents_response.json()
-
-                if "result" in incidents_data:
-                    latest_incident = incidents_data["result"][0]
-                    incident_number = latest_incident["number"]
-                    incident_description = latest_incident.get("description", "No description available")
-                    incident_short_description = latest_incident.get("short_description", "No short description available")
-                    incident_state_number = latest_incident.get("incident_state", "Unknown")
-                    incident_status = incident_state_mapping.get(incident_state_number, "Unknown")
-                    return {"ticket_id": incident_number, "short_description": incident_short_description, "description": incident_description, "status": incident_status}
-                else:
-                    return {"error": f"No incidents found for the email {user_email}"}
-            else:
-                return {"error": "Error while fetching incidents"}
-        else:
-            return {"error": f"No user found with the email {user_email}"}
-    else:
-        return {"error": "Error fetching user data"}
+    # Dot-walking through caller_id filters on the user's email directly, so no
+    # separate sys_user lookup is needed.
+    try:
+        result = await tables.query(
+            "incident",
+            query=f"caller_id.email={user_email}^ORDERBYDESCsys_updated_on",
+            fields=INCIDENT_FIELDS,
+            limit=1
+        )
+    except Exception:
+        return {"error": "Error while fetching incidents"}
+
+    if not result:
+        return {"error": f"No incidents found for the email {user_email}"}
+
+    latest_incident = result[0]
+    incident_number = latest_incident["number"]
+    incident_description = latest_incident.get("description", "No description available")
+    incident_short_description = latest_incident.get("short_description", "No short description available")
+    incident_state_number = latest_incident.get("incident_state", "Unknown")
+    incident_status = incident_state_mapping.get(incident_state_number, "Unknown")
+    return {"ticket_id": incident_number, "short_description": incident_short_description, "description": incident_description, "status": incident_status}
 
 class ActionFetchTicket(Action):
     def name(self):
         return "action_fetch_ticket"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         ticket_id_or_email = tracker.get_slot("ticket_id_or_email")
         ticket_id = None
         user_email = None
@@ -174,7 +257,7 @@ class ActionFetchTicket(Action):
                 events.append(SlotSet("user_email", user_email))
 
         if ticket_id:
-            result = fetch_ticket_by_id(ticket_id)
+            result = await fetch_ticket_by_id(ticket_id)
             if "error" in result:
                 dispatcher.utter_message(f"Failed to fetch the ticket: {result['error']}")
             else:
@@ -188,7 +271,7 @@ class ActionFetchTicket(Action):
                 dispatcher.utter_message("Let me know if you need anything else.")
 
         elif user_email:
-            result = fetch_ticket_by_email(user_email)
+            result = await fetch_ticket_by_email(user_email)
             if "error" in result:
                 dispatcher.utter_message(f"Failed to fetch the ticket: {result['error']}")
             else:
@@ -218,31 +301,23 @@ class ActionFetchTicket(Action):
 
         return events
 
-def get_tickets_by_email(user_email):
-    url = (
-        f"https://{instance}.service-now.com/api/now/table/incident"
-        f"?sysparm_query=caller_id.email={user_email}^incident_stateNOT IN6,7^ORDERBYDESCsys_created_on"
-        f"&sysparm_fields=number,short_description,incident_state"
-    )
-
-    response = requests.get(
-        url,
-        auth=HTTPBasicAuth(username, password),
-        headers=headers
-    )
-
-    if response.status_code != 200:
+async def get_tickets_by_email(user_email):
+    try:
+        return await tables.query(
+            "incident",
+            query=f"caller_id.email={user_email}^incident_stateNOT IN6,7^ORDERBYDESCsys_created_on",
+            fields=["sys_id", "number", "short_description", "incident_state"]
+        )
+    except Exception:
         return []
 
-    return response.json().get("result", [])
-
 class ActionAskUpdateTicketFormTicketId(Action):
     def name(self):
         return "action_ask_update_ticket_form_ticket_id_update"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         user_email = tracker.get_slot("user_email")
-        tickets = get_tickets_by_email(user_email) if user_email else []
+        tickets = await get_tickets_by_email(user_email) if user_email else []
 
         if not tickets:
             dispatcher.utter_message(
@@ -277,9 +352,9 @@ class ActionAskUpdateTicketStatusFormTicketId(Action):
     def name(self):
         return "action_ask_update_ticket_status_form_ticket_id_update"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         user_email = tracker.get_slot("user_email")
-        tickets = get_tickets_by_email(user_email) if user_email else []
+        tickets = await get_tickets_by_email(user_email) if user_email else []
 
         if not tickets:
             dispatcher.utter_message(
@@ -303,34 +378,35 @@ class ActionAskUpdateTicketStatusFormTicketId(Action):
             for t in tickets
         ]
 
+        # Several ticket IDs in ticket_id_update make action_update_ticket_status
+        # update them all at once.
+        if len(tickets) > 1:
+            buttons.append({
+                "title": f"All {len(tickets)} tickets above",
+                "payload": ", ".join(t.get("number") for t in tickets)
+            })
+
         dispatcher.utter_message(
-            text="Please select the ticket you want to update:",
+            text="Please select the ticket you want to update, or type several ticket IDs separated by commas:",
             buttons=buttons
         )
 
         return []
 
-def update_ticket_description(ticket_id, new_description):   
-    sys_id = None
-    
-    url_sys_id = f"https://{instance}.service-now.com/api/now/table/incident?sysparm_query=number={ticket_id}"
-    response_sys_id = requests.get(url_sys_id, auth=HTTPBasicAuth(username,password), headers=headers)
-
-    if response_sys_id.status_code == 200:
-        data_sys_id = response_sys_id.json()
-        if "result" in data_sys_id and len(data_sys_id["result"]) > 0:
-            sys_id = data_sys_id["result"][0]["sys_id"]
-
-    if not sys_id:
-        return {"error": f"No incident found with ID {ticket_id}"}
-
-    url = f"https://{instance}.service-now.com/api/now/table/incident/{sys_id}"
-
+async def update_ticket_description(ticket_id, new_description):   
     data = {
         "description": new_description
     }
 
-    response = requests.put(url, auth=HTTPBasicAuth(username, password), headers=headers, json=data)
+    # A ticket picked from a listing is already known by sys_id, so this is a
+    # single PUT; otherwise the number is looked up once and remembered.
+    try:
+        response = await tables.update_incident(ticket_id, data, fields=["number"], method="PUT")
+    except Exception:
+        return {"error": f"Error updating ticket with ID {ticket_id}"}
+
+    if response is None:
+        return {"error": f"No incident found with ID {ticket_id}"}
 
     if response.status_code == 200:
         data = response.json()
@@ -347,7 +423,7 @@ class ActionUpdateTicketDescription(Action):
     def name(self):
         return "action_update_ticket_description"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         user_email = tracker.get_slot("user_email")
         ticket_id = tracker.get_slot("ticket_id_update")
         new_description = tracker.get_slot("new_description")
@@ -360,7 +436,7 @@ class ActionUpdateTicketDescription(Action):
                 SlotSet("new_description", None),
             ]
         
-        result = update_ticket_description(ticket_id, new_description)
+        result = await update_ticket_description(ticket_id, new_description)
 
         if "error" in result:
             dispatcher.utter_message(f"Failed to update the ticket : {result['error']}")
@@ -380,10 +456,9 @@ class ActionUpdateTicketDescription(Action):
             SlotSet("new_description", None),
         ]
 
-def update_ticket_status(ticket_id, new_status):
-    if not new_status:
-        return {"error": "Missing status."}
-
+def status_update_data(new_status):
+    # The normalised status and the fields to PATCH for it; the fields are None
+    # for anything but resolve/close.
     new_status = new_status.lower().strip()
 
     if new_status in ["resolve", "resolved"]:
@@ -391,31 +466,13 @@ def update_ticket_status(ticket_id, new_status):
     elif new_status in ["close", "closed"]:
         new_status = "closed"
 
-    sys_id = None
-    url_sys_id = f"https://{instance}.service-now.com/api/now/table/incident?sysparm_query=number={ticket_id}"
-    response_sys_id = requests.get(
-        url_sys_id,
-        auth=HTTPBasicAuth(username, password),
-        headers=headers
-    )
-
-    if response_sys_id.status_code == 200:
-        data_sys_id = response_sys_id.json()
-        if data_sys_id.get("result"):
-            sys_id = data_sys_id["result"][0]["sys_id"]
-
-    if not sys_id:
-        return {"error": f"No incident found with ID {ticket_id}"}
-
     status_map = {
         "resolved": "6",
         "closed": "7"
     }
 
     if new_status not in status_map:
-        return {"error": "Only resolve or close is allowed."}
-
-    url = f"https://{instance}.service-now.com/api/now/table/incident/{sys_id}"
+        return new_status, None
 
     data = {
         "state": status_map[new_status]
@@ -435,12 +492,23 @@ def update_ticket_status(ticket_id, new_status):
             "close_notes": "Closed via chatbot after user confirmation."
         })
 
-    response = requests.patch(
-        url,
-        auth=HTTPBasicAuth(username, password),
-        headers=headers,
-        json=data
-    )
+    return new_status, data
+
+async def update_ticket_status(ticket_id, new_status):
+    if not new_status:
+        return {"error": "Missing status."}
+
+    new_status, data = status_update_data(new_status)
+    if data is None:
+        return {"error": "Only resolve or close is allowed."}
+
+    try:
+        response = await tables.update_incident(ticket_id, data, fields=["number"])
+    except Exception as e:
+        return {"error": f"ServiceNow error: {e}"}
+
+    if response is None:
+        return {"error": f"No incident found with ID {ticket_id}"}
 
     if response.status_code == 200:
         result = response.json().get("result", {})
@@ -454,11 +522,40 @@ def update_ticket_status(ticket_id, new_status):
         "error": f"ServiceNow error ({response.status_code}): {response.text}"
     }
 
+async def update_ticket_statuses(ticket_ids, new_status):
+    if not new_status:
+        return {"error": "Missing status."}
+
+    new_status, data = status_update_data(new_status)
+    if data is None:
+        return {"error": "Only resolve or close is allowed."}
+
+    # One Batch API request for all tickets, see ServiceNowTables.update_incidents.
+    try:
+        results = await tables.update_incidents({ticket_id: data for ticket_id in ticket_ids}, fields=["number"])
+    except Exception as e:
+        return {"error": f"ServiceNow error: {e}"}
+
+    tickets = []
+    for ticket_id in ticket_ids:
+        status_code, text = results[ticket_id]
+
+        if status_code == 200:
+            tickets.append({"ticket_id": ticket_id, "updated": True})
+        elif status_code == 404:
+            tickets.append({"ticket_id": ticket_id, "updated": False, "error": f"No incident found with ID {ticket_id}"})
+        elif status_code is None:
+            tickets.append({"ticket_id": ticket_id, "updated": False, "error": f"ServiceNow error: {text}"})
+        else:
+            tickets.append({"ticket_id": ticket_id, "updated": False, "error": f"ServiceNow error ({status_code})"})
+
+    return {"status": new_status, "tickets": tickets}
+
 class ActionUpdateTicketStatus(Action):
     def name(self):
         return "action_update_ticket_status"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         user_email = tracker.get_slot("user_email")
         ticket_id = tracker.get_slot("ticket_id_update")
         new_status = tracker.get_slot("new_status")
@@ -471,7 +568,11 @@ class ActionUpdateTicketStatus(Action):
                 SlotSet("new_status", None),
             ]
 
-        result = update_ticket_status(ticket_id, new_status)
+        ticket_ids = list(dict.fromkeys(re.findall(r"\bINC\d{6,}\b", ticket_id.upper())))
+        if len(ticket_ids) > 1:
+            return await self.run_bulk(dispatcher, ticket_ids, new_status)
+
+        result = await update_ticket_status(ticket_id, new_status)
 
         if "error" in result:
             dispatcher.utter_message(f"Failed to update the ticket status: {result['error']}")
@@ -491,19 +592,36 @@ class ActionUpdateTicketStatus(Action):
             SlotSet("new_status", None),
         ]
 
-def fetch_user_tickets(user_email, num_tickets = 5):    
-    url_sys_id = f"https://{instance}.service-now.com/api/now/table/sys_user?sysparm_query=email={user_email}"
-    response_sys_id = requests.get(url_sys_id, auth=HTTPBasicAuth(username, password), headers=headers)
+    async def run_bulk(self, dispatcher, ticket_ids, new_status):
+        result = await update_ticket_statuses(ticket_ids, new_status)
 
-    if response_sys_id.status_code == 200:
-        data = response_sys_id.json()
-        if "result" in data and len(data["result"]) > 0:
-            sys_id = data["result"][0]["sys_id"]
-        else:
-            return {"error": f"No user found with Email Id {user_email}"}
-    else:
-        return {"error": "Error fetching user data"}
-    
+        if "error" in result:
+            dispatcher.utter_message(f"Failed to update the ticket statuses: {result['error']}")
+            dispatcher.utter_message("Let me know if you need anything else.")
+            return [
+                SlotSet("user_email", None),
+                SlotSet("ticket_id_update", None),
+                SlotSet("new_status", None),
+            ]
+
+        tickets = result["tickets"]
+        updated = sum(t["updated"] for t in tickets)
+        lines = [
+            f"{t['ticket_id']} - {result['status']}" if t["updated"] else f"{t['ticket_id']} - failed: {t['error']}"
+            for t in tickets
+        ]
+
+        dispatcher.utter_message(
+            text=f"Updated {updated} of {len(tickets)} tickets to {result['status']}:\n" + "\n".join(lines)
+        )
+        dispatcher.utter_message("Let me know if you need anything else.")
+
+        return [
+            SlotSet("ticket_id_update", None),
+            SlotSet("new_status", None),
+        ]
+
+async def fetch_user_tickets(user_email, num_tickets = 5):    
     incident_state_mapping = {
             "1": "New",
             "2": "In Progress",
@@ -511,44 +629,42 @@ def fetch_user_tickets(user_email, num_tickets = 5):
             "4": "Closed"
         }
 
-    incidents_url = (
-        f"https://{instance}.service-now.com/api/now/table/incident"
-        f"?sysparm_query=caller_id={sys_id}^ORDERBYDESCsys_created_on"
-        f"&sysparm_limit={num_tickets}"
-    )
-
-    incidents_response = requests.get(incidents_url, auth=HTTPBasicAuth(username, password), headers=headers)
-
-    if incidents_response.status_code == 200:
-        incidents_data = incidents_response.json()
-        if "result" in incidents_data and len(incidents_data["result"]) > 0:
-            tickets = []
-            for incident in incidents_data["result"]:
-                incident_number = incident["number"]
-                incident_description = incident.get("description", "No description available")
-                incident_state_number = incident.get("incident_state", "Unknown")
-                incident_status = incident_state_mapping.get(incident_state_number, "Unknown")
-
-                tickets.append({
-                    "ticket_id": incident_number,
-                    "description": incident_description,
-                    "status": incident_status
-                })
-            return tickets
-        else:
-            return {"error": f"No incidents found for user with email {user_email}"}
-    else:
+    try:
+        incidents = await tables.query(
+            "incident",
+            query=f"caller_id.email={user_email}^ORDERBYDESCsys_created_on",
+            fields=["sys_id", "number", "description", "incident_state"],
+            limit=num_tickets
+        )
+    except Exception:
         return {"error": "Error fetching incidents"}
 
+    if not incidents:
+        return {"error": f"No incidents found for user with email {user_email}"}
+
+    tickets = []
+    for incident in incidents:
+        incident_number = incident["number"]
+        incident_description = incident.get("description", "No description available")
+        incident_state_number = incident.get("incident_state", "Unknown")
+        incident_status = incident_state_mapping.get(incident_state_number, "Unknown")
+
+        tickets.append({
+            "ticket_id": incident_number,
+            "description": incident_description,
+            "status": incident_status
+        })
+    return tickets
+
 class ActionFetchLastTickets(Action):
     def name(self):
         return "action_fetch_last_tickets"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         user_email = tracker.get_slot("user_email")
         num_tickets = tracker.get_slot("num_tickets") or 5
         
-        result = fetch_user_tickets(user_email, int(num_tickets))
+        result = await fetch_user_tickets(user_email, int(num_tickets))
 
         if "error" in result:
             dispatcher.utter_message(f"Failed to fetch tickets: {result['error']}")
@@ -572,12 +688,9 @@ class ActionGetHRResponse(Action):
     def name(self):
         return "action_get_hr_response"
     
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         user_query = tracker.latest_message.get("text")
         domain_name = os.getenv("PROGRESSIVE_DOMAIN")
-        BEARER_TOKEN = os.getenv("BEARER_TOKEN")
-        
-        url = os.getenv("API_URL")
 
         payload = {
             "inputs": {"domain_name": domain_name},
@@ -593,14 +706,9 @@ class ActionGetHRResponse(Action):
                 }
             ]
         }
-        
-        headers = {
-            "Authorization": f"Bearer {BEARER_TOKEN}",
-            "Content-Type": "application/json"
-        }
 
         try:
-            response = requests.request("POST", url, json=payload, headers=headers)
+            response = await dify.post(json=payload)
             response_data = response.json()
             raw_answer = response_data.get("answer", "")
             clean_answer = re.search(r'</think>(.*)', raw_answer, re.DOTALL)
@@ -669,12 +777,9 @@ class ActionGetWorkElevateResponse(Action):
     def name(self):
         return "action_get_workelevate_response"
     
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         user_query = tracker.latest_message.get("text")
         domain_name = os.getenv("WORKELEVATE_DOMAIN")
-        BEARER_TOKEN = os.getenv("BEARER_TOKEN")
-
-        url = os.getenv("API_URL")
 
         payload = {
             "inputs": {"domain_name": domain_name},
@@ -690,14 +795,9 @@ class ActionGetWorkElevateResponse(Action):
                 }
             ]
         }
-   
-        headers = {
-            "Authorization": f"Bearer {BEARER_TOKEN}",
-            "Content-Type": "application/json"
-        }
 
         try:
-            response = requests.request("POST", url, json=payload, headers=headers)
+            response = await dify.post(json=payload)
             response_data = response.json()
             raw_answer = response_data.get("answer", "")
             clean_answer = re.search(r'</think>(.*)', raw_answer, re.DOTALL)
@@ -721,8 +821,8 @@ class ActionFallback(Action):
         dispatcher.utter_message("Sorry, I don't understand that. Can you please rephrase or ask something related to HR policies, WorkElevate or any issue you are facing?")
         return []
 
-def schedule_agent_job(user_identity, item_id, action_code, custom_job_name=None):
-    url = "https://dev.workelevate.com/api/Chatbot/JobScheduler"
+async def schedule_agent_job(user_identity, item_id, action_code, custom_job_name=None):
+    url = "/JobScheduler"
 
     payload = {
         "user_identity": user_identity,
@@ -732,17 +832,10 @@ def schedule_agent_job(user_identity, item_id, action_code, custom_job_name=None
         "custom_job_name": custom_job_name or ""
     }
 
-    headers = {
-        "accept": "text/plain",
-        "Authorization": f"Bearer {os.getenv('JOB_SCHEDULER_SYNC_DATA_BEARER_TOKEN')}",
-        "Content-Type": "application/json-patch+json"
-    }
-
-    response = requests.post(
+    response = await workelevate.post(
         url,
         data=json.dumps(payload),
-        headers=headers,
-        timeout=10
+        headers={"accept": "text/plain"}
     )
 
     response.raise_for_status()
@@ -771,7 +864,7 @@ class ActionFindTroubleshooter(Action):
     def name(self):
         return "action_find_troubleshooter"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         user_query = tracker.latest_message.get("text", "").strip()
 
         if not user_query:
@@ -779,13 +872,15 @@ class ActionFindTroubleshooter(Action):
             return [FollowupAction("action_listen")]
 
         try:
-            response = requests.post(
-                "http://localhost:8000/match",
-                json={"query": user_query},
-                timeout=3
-            )
-            response.raise_for_status()
-            data = response.json()
+            if TROUBLESHOOTER_MATCHER == "embedded":
+                data = await match_embedded(user_query)
+            else:
+                response = await embedding_service.post(
+                    json={"query": user_query},
+                    headers={"X-Request-Timeout-Ms": "3000"}
+                )
+                response.raise_for_status()
+                data = response.json()
         except Exception as e:
             dispatcher.utter_message(
                 f"I'm having trouble analyzing your issue right now. ---- {e}"
@@ -839,7 +934,7 @@ class ActionRunSelectedTroubleshooter(Action):
     def name(self):
         return "action_run_selected_troubleshooter"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         t = tracker.get_slot("selected_troubleshooter")
         email = tracker.get_slot("user_email")
 
@@ -874,7 +969,7 @@ class ActionRunSelectedTroubleshooter(Action):
             return [FollowupAction("action_listen")]
 
         try:
-            schedule_agent_job(
+            await schedule_agent_job(
                 user_identity=email,
                 item_id=str(item_id),
                 action_code="TRBL",
@@ -903,12 +998,9 @@ class ActionGetTroubleshooterSOP(Action):
     def name(self):
         return "action_get_troubleshooter_sop"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         user_query = tracker.get_slot("user_query")
         domain_name = os.getenv("PROGRESSIVE_DOMAIN")
-        BEARER_TOKEN = os.getenv("BEARER_TOKEN")
-
-        url = os.getenv("API_URL")
 
         payload = {
             "inputs": {"domain_name": domain_name},
@@ -924,14 +1016,9 @@ class ActionGetTroubleshooterSOP(Action):
                 }
             ]
         }
-        
-        headers = {
-            "Authorization": f"Bearer {BEARER_TOKEN}",
-            "Content-Type": "application/json"
-        }
 
         try:
-            response = requests.request("POST", url, json=payload, headers=headers)
+            response = await dify.post(json=payload)
             response_data = response.json()
             raw_answer = response_data.get("answer", "")
             clean_answer = re.search(r'</think>(.*)', raw_answer, re.DOTALL)
@@ -1050,7 +1137,7 @@ class ActionHandleSoftwareRequest(Action):
     def name(self):
         return "action_handle_software_request"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         software_query = tracker.get_slot("software_name")
         confirmed_software = tracker.get_slot("confirmed_software_name")
         email = tracker.get_slot("user_email")
@@ -1058,7 +1145,7 @@ class ActionHandleSoftwareRequest(Action):
         if confirmed_software:
             software_name = confirmed_software
 
-            matches = resolve_software_matches(software_name)
+            matches = await resolve_software_matches(software_name)
             if not matches:
                 dispatcher.utter_message("1. I couldn’t find 1 that software in our approved catalog. I’ll raise a ticket for you.")
                 return [
@@ -1120,7 +1207,7 @@ class ActionHandleSoftwareRequest(Action):
             email = email.split("@")[0]
 
             try:
-                schedule_agent_job(
+                await schedule_agent_job(
                     user_identity=email,
                     item_id=software_info.get("software_id"),
                     action_code="SFT",
@@ -1158,7 +1245,7 @@ class ActionHandleSoftwareRequest(Action):
                 FollowupAction("create_ticket_form")
             ]
 
-        matches = resolve_software_matches(software_query)
+        matches = await resolve_software_matches(software_query)
 
         if not matches:
             dispatcher.utter_message("I couldn’t find that 2 software in our approved catalog. I’ll raise a ticket for you.")
@@ -1237,7 +1324,7 @@ class ActionHandleSoftwareRequest(Action):
         email = email.split("@")[0]
 
         try:
-            schedule_agent_job(
+            await schedule_agent_job(
                 user_identity=email,
                 item_id=software_info.get("software_id"),
                 action_code="SFT",
@@ -1259,8 +1346,8 @@ class ActionHandleSoftwareRequest(Action):
             FollowupAction("action_listen")
         ]
 
-def get_action_list(sync_type):
-    url = "https://dev.workelevate.com/api/Chatbot/SyncActionData"
+async def get_action_list(sync_type):
+    url = "/SyncActionData"
 
     payload = {
         'machine_name': '',
@@ -1271,17 +1358,10 @@ def get_action_list(sync_type):
         'platform_id': 1
     }
 
-    headers = {
-        "accept": "*/*",
-        "Authorization": f"Bearer {os.getenv('JOB_SCHEDULER_SYNC_DATA_BEARER_TOKEN')}",
-        "Content-Type": "application/json-patch+json"
-    }
-
-    response = requests.post(
+    response = await workelevate.post(
         url,
         data=json.dumps(payload),
-        headers=headers,
-        timeout=10
+        headers={"accept": "*/*"}
     )
 
     response.raise_for_status()
@@ -1291,8 +1371,8 @@ def get_action_list(sync_type):
     except Exception:
         return response.text
 
-def get_software_catalog_map():
-    data = get_action_list(sync_type=2)
+async def get_software_catalog_map():
+    data = await get_action_list(sync_type=2)
 
     catalog = {}
     for s in data:
@@ -1302,12 +1382,13 @@ def get_software_catalog_map():
 
     return catalog
 
-def resolve_software_matches(software_name: str, limit: int = 5, threshold: int = 70):
-    SOFTWARES = get_software_catalog_map()
+async def resolve_software_matches(software_name: str, limit: int = 5, threshold: int = 70):
+    SOFTWARES = await get_software_catalog_map()
 
-    matches = process.extract(
+    matches = await run_blocking(
+        process.extract,
         software_name,
-        SOFTWARES.keys(),
+        list(SOFTWARES.keys()),
         limit=limit,
         scorer=fuzz.partial_ratio,
         processor=lambda s: s.lower()
@@ -1369,14 +1450,14 @@ class ActionListPrintersByLocation(Action):
     def name(self):
         return "action_list_printers_by_location"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         location = tracker.get_slot("printer_location")
 
         if not location:
             dispatcher.utter_message("Please select a location.")
             return []
 
-        printers_data = get_action_list(sync_type = 1)
+        printers_data = await get_action_list(sync_type = 1)
         printers = [
             p for p in printers_data
             if p.get("is_active")
@@ -1412,7 +1493,7 @@ class ActionTriggerPrinterInstallation(Action):
     def name(self):
         return "action_trigger_printer_installation"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         printer = tracker.get_slot("selected_printer")
         email = tracker.get_slot("user_email")
         location = tracker.get_slot("printer_location")
@@ -1421,7 +1502,7 @@ class ActionTriggerPrinterInstallation(Action):
             dispatcher.utter_message("Missing details to proceed.")
             return []
 
-        printers_data = get_action_list(sync_type = 1)
+        printers_data = await get_action_list(sync_type = 1)
         selected = next(
             (p for p in printers_data if str(p.get("driver_id")) == str(printer)),
             None
@@ -1435,7 +1516,7 @@ class ActionTriggerPrinterInstallation(Action):
 
         email = email.split("@")[0]
         try:
-            schedule_agent_job(
+            await schedule_agent_job(
                 user_identity=email,
                 item_id=str(selected.get("driver_id")),
                 action_code="PRT",
@@ -0,0 +1,119 @@
+import json, os, threading
+import numpy as np
+
+
+class EmbeddedMatcher:
+    # Troubleshooter matching inside the action server without the embedding
+    # service's stack (torch, sentence-transformers, qdrant-client), which does not
+    # install next to rasa 2.8. Queries are encoded by an ONNX export of the
+    # service's model through onnxruntime + tokenizers, then searched exactly
+    # against the local index snapshot the service writes (LOCAL_INDEX_SNAPSHOT,
+    # <path>.npy + <path>.json). The snapshot is re-read whenever the service
+    # replaces it. Category nodes (parent_id = 0) are never returned, and a
+    # snapshot indexed with a different model than `model_name` is refused.
+
+    def __init__(self, snapshot_path, model_path, tokenizer_path, model_name, max_length=384, threshold=0.25, top_k=3):
+        self.snapshot_path = snapshot_path
+        self.model_path = model_path
+        self.tokenizer_path = tokenizer_path
+        self.model_name = model_name
+        self.max_length = max_length
+        self.threshold = threshold
+        self.top_k = top_k
+
+        self.session = None
+        self.inputs = set()
+        self.tokenizer = None
+        self.snapshot = ([], np.zeros((0, 0), dtype=np.float32))
+        self._snapshot_mtime = None
+        self._lock = threading.Lock()
+
+    def load_encoder(self):
+        # Imported here so the action server only needs these packages when
+        # TROUBLESHOOTER_MATCHER=embedded.
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = int(os.getenv("EMBEDDED_MATCHER_THREADS", 1))
+        self.session = onnxruntime.InferenceSession(
+            self.model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.inputs = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(self.tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.no_padding()
+
+    def refresh_snapshot(self):
+        mtime = os.path.getmtime(self.snapshot_path + ".json")
+        if mtime == self._snapshot_mtime:
+            return
+
+        with open(self.snapshot_path + ".json") as f:
+            meta = json.load(f)
+
+        matrix = np.load(self.snapshot_path + ".npy")
+        if len(matrix) != len(meta["ids"]):
+            raise ValueError(f"Snapshot {self.snapshot_path} is inconsistent: {len(matrix)} vectors for {len(meta['ids'])} ids")
+
+        # encoder ids look like "<model>:<backend>[:<onnx file>][:d<dim>]"; the ONNX
+        # export here stands in for any backend of the same model.
+        encoders = {p.get("encoder") for p in meta["payloads"] if p.get("encoder")}
+        if any(e.split(":")[0] != self.model_name for e in encoders):
+            raise ValueError(f"Snapshot {self.snapshot_path} was indexed with {', '.join(sorted(encoders))}, not {self.model_name}")
+
+        leaves = [i for i, p in enumerate(meta["payloads"]) if p.get("parent_id")]
+        self.snapshot = (
+            [meta["payloads"][i] for i in leaves],
+            np.ascontiguousarray(matrix[leaves], dtype=np.float32)
+        )
+        self._snapshot_mtime = mtime
+        print(f"[EMBEDDED MATCHER] - loaded {len(leaves)} troubleshooters from {self.snapshot_path}")
+
+    def start(self):
+        # Cheap once loaded: a stat of the snapshot to pick up a newer one.
+        with self._lock:
+            if self.session is None:
+                self.load_encoder()
+            self.refresh_snapshot()
+        return self
+
+    def encode(self, text, dim):
+        encoding = self.tokenizer.encode(text)
+        feed = {
+            "input_ids": np.array([encoding.ids], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids], dtype=np.int64)
+        }
+        hidden = self.session.run(None, {k: v for k, v in feed.items() if k in self.inputs})[0]
+
+        # Mean pooling over the real tokens, as sentence-transformers does, cut to
+        # the snapshot's dimension (EMBEDDING_DIM) and L2-normalized.
+        mask = feed["attention_mask"][..., None].astype(np.float32)
+        vector = (hidden * mask).sum(axis=1)[0] / max(mask.sum(), 1.0)
+        vector = vector[:dim]
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def match(self, query):
+        self.start()
+        payloads, matrix = self.snapshot
+        if not payloads:
+            return {"matches": [], "tier": "embedded"}
+
+        scores = matrix @ self.encode(query, matrix.shape[1])
+
+        matches = []
+        for i in np.argsort(-scores)[:self.top_k]:
+            if scores[i] < self.threshold:
+                break
+
+            payload = payloads[i]
+            matches.append({
+                "troubleshooter_id": payload.get("troubleshooter_id"),
+                "ps_command_id": payload.get("ps_command_id"),
+                "name": payload.get("name"),
+                "score": float(scores[i])
+            })
+
+        return {"matches": matches, "tier": "embedded"}
@@ -0,0 +1,155 @@
+import json, os, time
+from collections import deque
+import aiohttp
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+SLOW_CALL_SECONDS = float(os.getenv("HTTP_SLOW_CALL_SECONDS", 2))
+LATENCY_WINDOW = 1000
+
+upstreams = {}
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HTTPError(Exception):
+    pass
+
+
+class Response:
+    # The body is read before the connection goes back to the pool, so callers
+    # get a plain object with the parts of the requests API the actions use.
+
+    def __init__(self, status_code, text, url):
+        self.status_code = status_code
+        self.text = text
+        self.url = url
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(f"{self.status_code} error for {self.url}: {self.text[:200]}")
+
+
+class Upstream:
+    # A keep-alive aiohttp connection pool for one upstream service, shared by
+    # every action and conversation. Each call reuses the pooled TCP/TLS
+    # connections, gets the upstream's default headers, auth and (connect, read)
+    # timeout, and has its latency recorded. At most `pool_size` connections are
+    # opened; further callers wait for a free one without blocking the loop.
+    # The session is created on first use so it binds to the server's event loop.
+
+    def __init__(self, name, base_url="", headers=None, auth=None,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, pool_size=POOL_SIZE):
+        self.name = name
+        self.base_url = base_url or ""
+        self.headers = headers or {}
+        self.auth = auth
+        self.timeout = client_timeout((connect_timeout, read_timeout))
+        self.pool_size = pool_size
+        self.session = None
+
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+        upstreams[name] = self
+
+    def url(self, path):
+        if path.startswith(("http://", "https://")):
+            return path
+        if not path:
+            return self.base_url
+        return self.base_url.rstrip("/") + path
+
+    def client(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                headers=self.headers,
+                auth=self.auth,
+                timeout=self.timeout
+            )
+        return self.session
+
+    def record(self, method, path, seconds, failed):
+        self.calls += 1
+        self.errors += failed
+        self.total_seconds += seconds
+        self._latencies.append(seconds)
+
+        if seconds >= SLOW_CALL_SECONDS:
+            print(f"[HTTP] - slow {self.name} call: {method} {path or '/'} took {round(seconds, 3)}s")
+
+    async def request(self, method, path="", timeout=None, **kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            async with self.client().request(
+                method,
+                self.url(path),
+                timeout=client_timeout(timeout) if timeout else self.timeout,
+                **kwargs
+            ) as response:
+                text = await response.text()
+
+            failed = response.status >= 500
+            return Response(response.status, text, str(response.url))
+        finally:
+            self.record(method, path, time.perf_counter() - started, failed)
+
+    async def get(self, path="", **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path="", **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path="", **kwargs):
+        return await self.request("PUT", path, **kwargs)
+
+    async def patch(self, path="", **kwargs):
+        return await self.request("PATCH", path, **kwargs)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def stats(self):
+        latencies = list(self._latencies)
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "mean_ms": round(self.total_seconds / self.calls * 1000, 1) if self.calls else None,
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None
+        }
+
+
+def client_timeout(timeout):
+    # Accepts a number of seconds or a requests-style (connect, read) tuple.
+    if isinstance(timeout, aiohttp.ClientTimeout):
+        return timeout
+    if isinstance(timeout, (tuple, list)):
+        connect, read = timeout
+        return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+    return aiohttp.ClientTimeout(total=timeout)
+
+
+def upstream_stats():
+    return {name: upstream.stats() for name, upstream in upstreams.items()}
+
+
+async def close_all():
+    for upstream in upstreams.values():
+        await upstream.close()
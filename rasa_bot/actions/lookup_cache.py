@@ -0,0 +1,82 @@
+import asyncio, time
+from collections import OrderedDict
+
+
+class LookupCache:
+    # Process-wide memo for remote lookups. A found value is kept for `ttl`
+    # seconds and a miss (the loader returned None) for `negative_ttl`, the least
+    # recently used entry is dropped once `max_size` is exceeded, and concurrent
+    # lookups of the same key share a single in-flight load. Loader errors are
+    # not cached.
+
+    def __init__(self, ttl=3600, negative_ttl=300, max_size=10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._pending = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return False, None
+
+        self._entries.move_to_end(key)
+        return True, value
+
+    def put(self, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0 or self.max_size <= 0:
+            return
+
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    async def _load(self, key, loader):
+        value = await loader(key)
+        self.put(key, value)
+        return value
+
+    def _forget(self, key, task):
+        if self._pending.get(key) is task:
+            del self._pending[key]
+
+    async def get(self, key, loader):
+        found, value = self.lookup(key)
+        if found:
+            self.hits += 1
+            return value
+
+        task = self._pending.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._pending[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+
+        # Shielded so a caller that gives up does not cancel the load for the others.
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared
+        }
@@ -0,0 +1,54 @@
+import asyncio, json, logging, os
+from rasa_sdk import utils
+from rasa_sdk.constants import APPLICATION_ROOT_LOGGER_NAME
+from rasa_sdk.endpoint import create_app, create_argument_parser, create_ssl_context
+from .http_client import close_all, upstream_stats
+
+# `rasa run actions` keeps its Sanic app to itself, so nothing could log the
+# pooled HTTP clients' stats or close them on shutdown. Starting the action
+# server with `python -m actions.server` (same arguments, from rasa_bot/) runs
+# the same app, logs upstream_stats() every HTTP_STATS_LOG_SECONDS (0 disables
+# it) and closes every pooled session when the server stops.
+STATS_LOG_SECONDS = float(os.getenv("HTTP_STATS_LOG_SECONDS", 300))
+
+
+def log_stats():
+    print(f"[HTTP] - upstream stats {json.dumps(upstream_stats())}")
+
+
+async def log_stats_every(seconds):
+    while True:
+        await asyncio.sleep(seconds)
+        log_stats()
+
+
+def main():
+    args = create_argument_parser().parse_args()
+
+    logging.getLogger("matplotlib").setLevel(logging.WARN)
+    utils.configure_colored_logging(args.loglevel)
+    utils.configure_file_logging(logging.getLogger(APPLICATION_ROOT_LOGGER_NAME), args.log_file, args.loglevel)
+    utils.update_sanic_log_level()
+
+    app = create_app(args.actions or __package__, cors_origins=args.cors, auto_reload=args.auto_reload)
+    stats_task = []
+
+    @app.listener("after_server_start")
+    async def start_stats_logging(app, loop):
+        if STATS_LOG_SECONDS > 0:
+            stats_task.append(loop.create_task(log_stats_every(STATS_LOG_SECONDS)))
+
+    @app.listener("after_server_stop")
+    async def close_upstreams(app, loop):
+        for task in stats_task:
+            task.cancel()
+        log_stats()
+        await close_all()
+
+    ssl_context = create_ssl_context(args.ssl_certificate, args.ssl_keyfile, args.ssl_password)
+    host = os.environ.get("SANIC_HOST", "0.0.0.0")
+    app.run(host, args.port, ssl=ssl_context, workers=utils.number_of_sanic_workers())
+
+
+if __name__ == "__main__":
+    main()
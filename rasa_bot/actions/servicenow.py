@@ -0,0 +1,165 @@
+import asyncio, base64, json, os, uuid
+from urllib.parse import quote, urlencode
+from .lookup_cache import LookupCache
+
+INCIDENT_NUMBER_CACHE_SIZE = int(os.getenv("INCIDENT_NUMBER_CACHE_SIZE", 10000))
+BATCH_PATH = "/api/now/v1/batch"
+BULK_CONCURRENCY = int(os.getenv("SERVICENOW_BULK_CONCURRENCY", 4))
+
+
+def table_path(table, sys_id=None, query=None, fields=None, limit=None):
+    # Reference fields come back as plain sys_ids/values instead of
+    # {"link": ..., "value": ...} objects, and only the listed columns are sent.
+    path = f"/api/now/table/{table}" + (f"/{sys_id}" if sys_id else "")
+    params = {"sysparm_exclude_reference_link": "true"}
+
+    if query:
+        params["sysparm_query"] = query
+    if fields:
+        params["sysparm_fields"] = ",".join(fields)
+    if limit:
+        params["sysparm_limit"] = limit
+
+    return f"{path}?{urlencode(params, safe=',^=@.', quote_via=quote)}"
+
+
+class ServiceNowTables:
+    # Table API access on top of a pooled Upstream. Every incident row that
+    # passes through here with its number and sys_id is remembered, so updating
+    # a ticket the user just picked from a listing is a single request. Numbers
+    # map to one sys_id for the life of the record, so entries only need a size
+    # bound; a stale one is dropped when the update hits a 404.
+
+    def __init__(self, upstream, number_cache_size=INCIDENT_NUMBER_CACHE_SIZE):
+        self.upstream = upstream
+        self.incident_sys_ids = LookupCache(ttl=float("inf"), negative_ttl=0, max_size=number_cache_size)
+
+    def remember(self, rows):
+        for row in rows:
+            if row.get("number") and row.get("sys_id"):
+                self.incident_sys_ids.put(row["number"].strip().upper(), row["sys_id"])
+
+    async def query(self, table, query=None, fields=None, limit=None):
+        response = await self.upstream.get(table_path(table, query=query, fields=fields, limit=limit))
+        response.raise_for_status()
+
+        rows = response.json().get("result", [])
+        if table == "incident":
+            self.remember(rows)
+        return rows
+
+    async def create(self, table, data, fields=None):
+        response = await self.upstream.post(table_path(table, fields=fields), json=data)
+        if response.status_code == 201 and table == "incident":
+            self.remember([response.json().get("result", {})])
+        return response
+
+    async def update(self, table, sys_id, data, fields=None, method="PATCH"):
+        return await self.upstream.request(method, table_path(table, sys_id=sys_id, fields=fields), json=data)
+
+    async def lookup_incident_sys_id(self, number):
+        rows = await self.query("incident", query=f"number={number}", fields=["sys_id", "number"], limit=1)
+        return rows[0]["sys_id"] if rows else None
+
+    async def incident_sys_id(self, number):
+        return await self.incident_sys_ids.get(number.strip().upper(), self.lookup_incident_sys_id)
+
+    async def update_incident(self, number, data, fields=None, method="PATCH"):
+        # Returns None when no incident has this number.
+        key = number.strip().upper()
+        sys_id = await self.incident_sys_id(key)
+        if not sys_id:
+            return None
+
+        response = await self.update("incident", sys_id, data, fields=fields, method=method)
+        if response.status_code == 404:
+            self.incident_sys_ids.invalidate(key)
+            sys_id = await self.incident_sys_id(key)
+            if not sys_id:
+                return None
+            response = await self.update("incident", sys_id, data, fields=fields, method=method)
+
+        return response
+
+    async def incident_sys_ids_for(self, numbers):
+        # Numbers not seen in an earlier listing are looked up with one query.
+        found, missing = {}, []
+        for number in numbers:
+            hit, sys_id = self.incident_sys_ids.lookup(number)
+            if hit:
+                found[number] = sys_id
+            else:
+                missing.append(number)
+
+        if missing:
+            rows = await self.query(
+                "incident", query="numberIN" + ",".join(missing), fields=["sys_id", "number"], limit=len(missing)
+            )
+            found.update({row["number"].strip().upper(): row["sys_id"] for row in rows})
+
+        return found
+
+    async def batch(self, requests):
+        # Sends [(id, method, path, body)] as one Batch API call and returns
+        # {id: (status_code, text)} for the requests ServiceNow serviced.
+        payload = {
+            "batch_request_id": uuid.uuid4().hex,
+            "rest_requests": [
+                {
+                    "id": request_id,
+                    "method": method,
+                    "url": path,
+                    "headers": [
+                        {"name": "Content-Type", "value": "application/json"},
+                        {"name": "Accept", "value": "application/json"}
+                    ],
+                    "body": base64.b64encode(json.dumps(body).encode("utf-8")).decode("ascii")
+                }
+                for request_id, method, path, body in requests
+            ]
+        }
+
+        response = await self.upstream.post(BATCH_PATH, json=payload)
+        response.raise_for_status()
+
+        return {
+            served["id"]: (served.get("status_code"), base64.b64decode(served.get("body") or "").decode("utf-8", "replace"))
+            for served in response.json().get("serviced_requests", [])
+        }
+
+    async def update_incidents(self, updates, fields=None, method="PATCH"):
+        # Applies {number: data} and returns {number: (status_code, text)}, with
+        # status_code None when the call itself failed. Everything goes out in
+        # one Batch API request; whatever it did not service (or all of it, if
+        # the Batch API is unavailable) falls back to single updates, at most
+        # BULK_CONCURRENCY at a time.
+        updates = {number.strip().upper(): data for number, data in updates.items()}
+        sys_ids = await self.incident_sys_ids_for(list(updates))
+
+        results = {
+            number: (404, f"No incident found with ID {number}")
+            for number in updates if number not in sys_ids
+        }
+        pending = [number for number in updates if number in sys_ids]
+
+        if pending:
+            try:
+                results.update(await self.batch([
+                    (number, method, table_path("incident", sys_id=sys_ids[number], fields=fields), updates[number])
+                    for number in pending
+                ]))
+            except Exception as e:
+                print(f"[SERVICENOW] - batch request failed, updating {len(pending)} incidents one by one: {e}")
+
+        slots = asyncio.Semaphore(BULK_CONCURRENCY)
+
+        async def single(number):
+            async with slots:
+                try:
+                    response = await self.update("incident", sys_ids[number], updates[number], fields=fields, method=method)
+                    return number, (response.status_code, response.text)
+                except Exception as e:
+                    return number, (None, str(e))
+
+        results.update(await asyncio.gather(*[single(number) for number in pending if number not in results]))
+        return results